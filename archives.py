@@ -0,0 +1,121 @@
+"""A single file archive of JSS objects that can stand in for a live source JSS"""
+import json
+import threading
+import xml.etree.ElementTree as etree
+import zipfile
+from jsslib import collections, ReadOnlyJSS
+
+__author__ = 'brysontyrrell'
+
+# The resource method for each url path
+_resources = dict((path, resource) for resource, (path, list_value) in collections.items())
+
+
+class Archive(ReadOnlyJSS):
+    """
+    A compressed archive of the objects on a JSS stored in a zip file at 'path'
+
+    Every object is a separate member named for its resource and id (e.g. 'computers/1.xml') so any object can be
+        read without unpacking the others. The 'index.json' member lists the ids and names of the objects of every
+        resource along with the version of the JSS and whether the objects were processed through the manifests
+
+    Open with mode 'w' to write an archive (see add() and close()) or 'r' to read one. An Archive opened for reading
+        answers the GET requests of the resource methods (see jsslib.ReadOnlyJSS). A KeyError is raised for anything
+        that is not in the archive. promoter.export_jss() and promoter.import_archive() write and read archives
+
+    set 'return_bytes' to True to have the resource methods return the XML of objects as bytes (see jsslib.JSS)
+    """
+    def __init__(self, path, mode='r', return_bytes=False):
+        """Initialize the Archive class"""
+        super(Archive, self).__init__()
+        self.path = path
+        self._return_bytes = return_bytes
+        self._lock = threading.Lock()
+        self._zip = zipfile.ZipFile(path, mode, zipfile.ZIP_DEFLATED, allowZip64=True)
+        if mode == 'r':
+            index = json.loads(self._zip.read('index.json').decode('utf-8'))
+            self.version = index['version']
+            self.processed = index['processed']
+            self._index = dict((resource, [tuple(i) for i in objects])
+                               for resource, objects in index['resources'].items())
+        else:
+            self.version = None
+            self.processed = False
+            self._index = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, resource, obj_id, name, xml):
+        """Writes the XML of an object to the archive"""
+        data = xml.encode('utf-8') if not isinstance(xml, bytes) else xml
+        with self._lock:
+            self._zip.writestr('{}/{}.xml'.format(resource, obj_id), data)
+            self._index.setdefault(resource, []).append((int(obj_id), name))
+
+    def ids(self, resource):
+        """Returns the sorted list of ids in the archive for a resource"""
+        return sorted(i for i, name in self._index.get(resource, []))
+
+    def get(self, resource, id_name):
+        """Returns the XML of an object by id or name or None if it is not in the archive"""
+        data = self._read(resource, id_name)
+        return data.decode('utf-8') if data is not None else None
+
+    def _read(self, resource, id_name):
+        """Returns the XML of an object as it is stored (bytes) or None if it is not in the archive"""
+        if not self._is_int(id_name):
+            id_name = next((i for i, name in self._index.get(resource, []) if name == id_name), None)
+            if id_name is None:
+                return None
+
+        try:
+            with self._lock:
+                return self._zip.read('{}/{}.xml'.format(resource, id_name))
+        except KeyError:
+            return None
+
+    def close(self):
+        """Writes the index (for an archive opened with mode 'w') and closes the archive"""
+        with self._lock:
+            if self._zip.mode != 'r':
+                index = {
+                    'version': self.version,
+                    'processed': self.processed,
+                    'resources': dict((resource, sorted(objects)) for resource, objects in self._index.items())
+                }
+                self._zip.writestr('index.json', json.dumps(index).encode('utf-8'))
+
+            self._zip.close()
+
+    def _collection(self, resource, list_value, group_filter):
+        """Returns the XML of a collection (the ids and names of the archived objects) the same way the JSS does"""
+        root = etree.Element(collections[resource][0])
+        for obj_id, name in sorted(self._index.get(resource, [])):
+            element = etree.SubElement(root, list_value)
+            etree.SubElement(element, 'id').text = str(obj_id)
+            etree.SubElement(element, 'name').text = name
+            if group_filter is not None:
+                etree.SubElement(element, 'is_smart').text = etree.fromstring(
+                    self._read(resource, obj_id)).findtext('is_smart')
+
+        return etree.tostring(root)
+
+    def _get(self, url, list_value=None, group_filter=None):
+        """Returns the archived XML for a url the same way jsslib.JSS._get() does"""
+        parts = url[len(self._url) + 1:].split('/')
+        resource = _resources.get(parts[0])
+        if resource is not None and len(parts) == 1:
+            xml = self._collection(resource, list_value or collections[resource][1], group_filter)
+        elif resource is not None and len(parts) >= 3:
+            xml = self._read(resource, parts[2]) if self._return_bytes else self.get(resource, parts[2])
+        else:
+            xml = None
+
+        if xml is None:
+            raise KeyError("'{}' is not in the archive {}".format(url, self.path))
+
+        return self._parse_get(xml, list_value, group_filter)
@@ -0,0 +1,205 @@
+"""An asyncio wrapper for the JSS REST API (requires Python 3 and aiohttp)"""
+import aiohttp
+import asyncio
+import logging
+from urllib.parse import quote
+from jsslib import BaseJSS, collections, read_version_cache, write_version_cache
+
+__author__ = 'brysontyrrell'
+
+
+class AsyncJSS(BaseJSS):
+    """
+    An object for interacting with the JSS REST API from asyncio code
+
+    The resource methods are the same as jsslib.JSS and return coroutines:
+        ids = await jss.computers()
+        xml = await jss.computer_groups(group_filter='smart')
+
+    'read_only', 'return_json', 'retry', 'version_cache' and 'version_max_age' behave the same as for jsslib.JSS
+
+    'limit' is the maximum number of connections the client will open to the JSS at once - requests beyond
+        that are queued by aiohttp
+
+    The client must be opened before use (which also reads the version of the JSS) and closed when finished:
+        async with AsyncJSS(url, username, password) as jss:
+            ...
+    """
+    def __init__(self, url, username, password, read_only=False, return_json=False, retry=None, limit=100,
+                 version_cache=None, version_max_age=86400):
+        """Initialize the AsyncJSS class"""
+        super().__init__(url, read_only=read_only, return_json=return_json, retry=retry)
+        self._auth = aiohttp.BasicAuth(username, password)
+        self._limit = limit
+        self._session = None
+        self._version_cache = version_cache
+        self._version_max_age = version_max_age
+        self.version = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def open(self):
+        """Creates the aiohttp session and reads the version of the JSS"""
+        self._session = aiohttp.ClientSession(auth=self._auth, connector=aiohttp.TCPConnector(limit=self._limit))
+        if self._version_cache:
+            self.version = read_version_cache(self._version_cache, self._url, self._version_max_age)
+
+        if not self.version:
+            self.version = await self._get_version()
+            if self._version_cache and self.version:
+                write_version_cache(self._version_cache, self._url, self.version)
+
+    async def close(self):
+        """Closes the aiohttp session"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, method, url, before_retry=None, **kwargs):
+        """
+        Sends a request and retries it according to the RetryPolicy
+            the body of the response is read before it is returned
+            raises an aiohttp.ClientResponseError once the policy gives up on a failing response
+            'before_retry' is a coroutine function awaited before every retry: if it returns a value other than None
+            that value is returned in place of the response and no further attempts are made
+        """
+        attempt = 0
+        while True:
+            try:
+                async with self._session.request(method, url, **kwargs) as resp:
+                    await resp.read()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if not self._retry.should_retry(method, attempt):
+                    raise
+
+                reason = e.__class__.__name__
+                delay = self._retry.backoff(attempt)
+            else:
+                if resp.status < 400 or not self._retry.should_retry(method, attempt, resp.status):
+                    resp.raise_for_status()
+                    return resp
+
+                reason = resp.status
+                delay = self._retry.backoff(attempt, resp.status, resp.headers)
+
+            attempt += 1
+            logging.warning("{} {} failed ({}): retry {} of {} in {:.1f}s".format(
+                method, url, reason, attempt, self._retry.retries[method], delay))
+            await asyncio.sleep(delay)
+            if before_retry is not None:
+                result = await before_retry()
+                if result is not None:
+                    return result
+
+    async def _probe(self, url):
+        """
+        Sends a single GET for an object to check the outcome of a failed write (not retried, see _existing_id() and
+            _deleted_id())
+            returns the text of the response, the status code of a failed response or None if the request itself
+            failed
+        """
+        try:
+            async with self._session.request('GET', url, headers={"Accept": "application/xml"}) as resp:
+                if resp.status >= 400:
+                    return resp.status
+
+                return await resp.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def _existing_id(self, url, data):
+        """Returns the id of an object on the JSS with the same name as the XML passed or None if there is none or
+            the JSS could not be checked"""
+        name = self._object_name(data)
+        if not name:
+            return None
+
+        text = await self._probe('{}/name/{}'.format(url, quote(name, safe='')))
+        if not isinstance(text, str):
+            return None
+
+        obj_id = self._parse_id(text)
+        logging.info("the object '{}' was created by a previous attempt: id {}".format(name, obj_id))
+        return obj_id
+
+    async def _deleted_id(self, url):
+        """Returns the id or name at the end of a url if the object no longer exists on the JSS, otherwise None (also
+            when the JSS could not be checked)"""
+        if await self._probe(url) != 404:
+            return None
+
+        logging.info("the object '{}' was deleted by a previous attempt".format(url))
+        return url.rsplit('/', 1)[1]
+
+    async def _get_version(self):
+        """Returns the version of the JSS (uses deprecated API)"""
+        resp = await self._request('GET', '{}/jssuser'.format(self._url))
+        return self._parse_version(await resp.text())
+
+    async def names(self, resource):
+        """Returns a dictionary of object names to ids (as integers) for a resource, e.g. names('computers')"""
+        self._check_supported(resource)
+        path, list_value = collections[resource]
+        return self._return_name_map(await self._get('{}/{}'.format(self._url, path)), list_value)
+
+    async def _get(self, url, list_value=None, group_filter=None):
+        """REST API GET request
+            returns a list of ids (as integers) for a collection
+            returns a string (xml text) for single objects"""
+        logging.debug('GET: {}'.format(url))
+        resp = await self._request('GET', url, headers=self._accept_header)
+        return self._parse_get(await resp.text(), list_value, group_filter)
+
+    async def _post(self, url, xml):
+        """REST API POST request
+            returns the id of the created resource
+            returns None if 'read_only' is True
+            a failed POST is only retried after checking the JSS for an object of the same name (see jsslib.JSS)"""
+        data = self._element_check(xml)
+        logging.debug('POST: {}'.format(url))
+        self._log_data(data)
+        if self._read_only:
+            logging.info("api read_only is enabled")
+            return None
+
+        resp = await self._request('POST', url + '/id/0', data=data, headers=self._content_header,
+                                   before_retry=lambda: self._existing_id(url, data))
+        if not isinstance(resp, aiohttp.ClientResponse):
+            return resp
+
+        return self._parse_id(await resp.text())
+
+    async def _put(self, url, xml):
+        """REST API PUT request
+            returns the id of the updated resource
+            returns None if 'read_only' is True"""
+        data = self._element_check(xml)
+        logging.debug('PUT: {}'.format(url))
+        self._log_data(data)
+        if self._read_only:
+            logging.info("api read_only is enabled")
+            return None
+
+        resp = await self._request('PUT', url, data=data, headers=self._content_header)
+        return self._parse_id(await resp.text())
+
+    async def _delete(self, url):
+        """REST API DELETE request
+            returns the id of the deleted resource
+            returns None if 'read_only' is True
+            a failed DELETE is only retried after checking the object is still on the JSS (see jsslib.JSS)"""
+        logging.debug('DELETE: {}'.format(url))
+        if self._read_only:
+            logging.info("api read_only is enabled")
+            return None
+
+        resp = await self._request('DELETE', url, before_retry=lambda: self._deleted_id(url))
+        if not isinstance(resp, aiohttp.ClientResponse):
+            return resp
+
+        return self._parse_id(await resp.text())
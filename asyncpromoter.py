@@ -0,0 +1,48 @@
+"""asyncio variant of promoter.promote_jss built on asyncjsslib.AsyncJSS (requires Python 3 and aiohttp)"""
+import aiohttp
+import asyncio
+import logging
+from manifests import resource_dependencies
+from promoter import dependency_order, fetch_object, process_xml, supported
+
+__author__ = 'brysontyrrell'
+
+
+async def promote_object(src_jss, trg_jss, resource, id_name):
+    """Fetches an object from the source JSS, applies the manifest and POSTs it to the target JSS"""
+    xml = await fetch_object(src_jss, resource, id_name)
+    new_object = process_xml(xml, resource, src_jss._metrics)
+    try:
+        await getattr(trg_jss, resource)(data=new_object)
+    except aiohttp.ClientResponseError as e:
+        if e.status == 409:
+            logging.warning(str(e))
+            logging.warning("the object '{} {}' has not been promoted".format(resource, id_name))
+        else:
+            raise
+
+
+async def promote_jss(src_jss, trg_jss, concurrency=100):
+    """
+    Promotes all objects from the source AsyncJSS to the target AsyncJSS
+        A resource is promoted once all of the resources it depends on (see manifests.resource_dependencies) have
+        been promoted. Objects are promoted concurrently with at most 'concurrency' objects in flight
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    promoted = dict((resource, asyncio.Event()) for resource in dependency_order(resource_dependencies))
+
+    async def promote(resource, id_name):
+        async with semaphore:
+            await promote_object(src_jss, trg_jss, resource, id_name)
+
+    async def promote_resource(resource):
+        for dependency in resource_dependencies[resource]:
+            await promoted[dependency].wait()
+
+        if supported(resource, src_jss, trg_jss):
+            logging.info("promoting resource: {}".format(resource))
+            await asyncio.gather(*[promote(resource, i) for i in await getattr(src_jss, resource)()])
+
+        promoted[resource].set()
+
+    await asyncio.gather(*[promote_resource(resource) for resource in promoted])
@@ -0,0 +1,214 @@
+"""
+Micro-benchmark of promoter.process_xml against the manifest being re-interpreted for every object
+
+    python benchmarks/bench_process_xml.py [--objects 2000] [--applications 200] [--processes 4 --threads 16]
+
+The previous implementation of process_xml is kept below as legacy_apply(), with the element helpers it used, so
+the two can be compared on the same synthetic computer records (parsing is timed separately). Both outputs are
+checked to be identical first.
+
+With --processes the throughput of parsing, processing and serializing the records from --threads threads is
+compared with sending them to a promoter.TransformPool of that many processes from the same threads.
+"""
+import argparse
+import logging
+from multiprocessing.pool import ThreadPool
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from manifests import manifests, global_exclusions, global_overrides, global_injections, global_collections
+import promoter
+from xmlbackend import etree
+
+__author__ = 'brysontyrrell'
+
+
+def remove_element(root, path):
+    """Removes an element from an ElementTree.Element object"""
+    parent, child = os.path.split(path)
+    try:
+        root.remove(root.find(child)) if not parent else root.find(parent).remove(root.find(path))
+    except (AttributeError, TypeError, ValueError):
+        logging.info("the element '{}' was not found".format(child))
+    else:
+        logging.info("the element '{}' was removed".format(child))
+
+
+def insert_override_element(root, path, value):
+    """
+    Inserts an element into an ElementTree.Element object or changes the value of an existing element
+        Child elements will be created for the passed path
+    """
+    children = path.split('/')
+    if root.find(children[0]) is None:
+        logging.info("creating element '{}'".format(children[0]))
+        etree.SubElement(root, children[0])
+
+    for p in range(1, len(children)):
+        parent_path = '/'.join([children[x] for x in range(p)])
+        child_path = '/'.join([children[x] for x in range(p + 1)])
+        if root.find(child_path) is None:
+            logging.info("creating element '{}'".format(children[p]))
+            etree.SubElement(root.find(parent_path), children[p])
+
+    root.find(path).text = value
+
+
+def remove_element_from_collection(root, path, element='id'):
+    """Takes an ElementTree.Element and searches a path for all instances of an element and removes them"""
+    collection = root.find(path)
+    if collection is not None:
+        logging.info("removing '{}' elements from collection: {}".format(element, path))
+        for i in list(collection):
+            try:
+                i.remove(i.find(element))
+            except (TypeError, ValueError):
+                logging.info("the element '{}' was not found".format(element))
+
+    else:
+        logging.info("the collection '{}' was not found".format(path))
+
+
+def legacy_process_xml(data, obj_type):
+    """process_xml() as it was before manifests were compiled into a ManifestPlan"""
+    return legacy_apply(etree.fromstring(data), obj_type)
+
+
+def legacy_apply(src_root, obj_type):
+    """Applies the global manifest and the manifest for 'obj_type' the way process_xml() used to"""
+    manifest = manifests.get(obj_type)
+    for element in global_exclusions:
+        remove_element(src_root, element)
+
+    for element, value in global_overrides.items():
+        insert_override_element(src_root, element, value)
+
+    for element, value in global_injections.items():
+        insert_override_element(src_root, element, value)
+
+    for element in global_collections:
+        remove_element_from_collection(src_root, element)
+
+    if manifest:
+        for element in manifest['exclude']:
+            remove_element(src_root, element)
+
+        for element, value in manifest['override'].items():
+            insert_override_element(src_root, element, value)
+
+        for element, value in manifest['inject'].items():
+            insert_override_element(src_root, element, value)
+
+        for element in manifest['collections']:
+            remove_element_from_collection(src_root, element)
+
+    return src_root
+
+
+def computer_xml(computer_id, applications):
+    """Returns the XML of a synthetic computer record"""
+    root = etree.Element('computer')
+    general = etree.SubElement(root, 'general')
+    for tag, text in (('id', computer_id), ('name', 'computer-{}'.format(computer_id)), ('serial_number', 'C02X'),
+                      ('distribution_point', 'dp1'), ('sus', 'sus1'), ('netboot_server', 'nb1')):
+        etree.SubElement(general, tag).text = str(text)
+
+    remote_management = etree.SubElement(general, 'remote_management')
+    etree.SubElement(remote_management, 'management_username').text = 'admin'
+    etree.SubElement(remote_management, 'management_password_md5').text = 'x' * 32
+    etree.SubElement(remote_management, 'management_password_sha256').text = 'x' * 64
+    site = etree.SubElement(general, 'site')
+    etree.SubElement(site, 'id').text = '-1'
+    location = etree.SubElement(root, 'location')
+    for tag in ('username', 'real_name', 'email_address', 'phone', 'building', 'room'):
+        etree.SubElement(location, tag).text = tag
+
+    etree.SubElement(root, 'purchasing').append(etree.Element('attachments'))
+    etree.SubElement(root, 'peripherals')
+    software = etree.SubElement(root, 'software')
+    apps = etree.SubElement(software, 'applications')
+    for i in range(applications):
+        app = etree.SubElement(apps, 'application')
+        etree.SubElement(app, 'name').text = 'Application {}.app'.format(i)
+        etree.SubElement(app, 'path').text = '/Applications/Application {}.app'.format(i)
+        etree.SubElement(app, 'version').text = '1.0.{}'.format(i)
+
+    extension_attributes = etree.SubElement(root, 'extension_attributes')
+    for i in range(20):
+        attribute = etree.SubElement(extension_attributes, 'extension_attribute')
+        etree.SubElement(attribute, 'id').text = str(i)
+        etree.SubElement(attribute, 'value').text = 'value {}'.format(i)
+
+    groups_accounts = etree.SubElement(root, 'groups_accounts')
+    etree.SubElement(groups_accounts, 'computer_group_memberships')
+    etree.SubElement(root, 'configuration_profiles')
+    return etree.tostring(root)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--objects', type=int, default=2000, help='number of computer records to process')
+    parser.add_argument('--applications', type=int, default=200, help='applications in each computer record')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timed runs (the best is reported)')
+    parser.add_argument('--processes', type=int, default=0, help='processes of the TransformPool to compare')
+    parser.add_argument('--threads', type=int, default=16, help='threads processing records for the comparison')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    records = [computer_xml(i, args.applications) for i in range(args.objects)]
+    for resource in ('computers', 'policies', 'buildings'):
+        for data in records[:10]:
+            if etree.tostring(legacy_process_xml(data, resource)) != \
+                    etree.tostring(promoter.process_xml(data, resource)):
+                raise SystemExit("process_xml output differs from the legacy output for '{}'".format(resource))
+
+    def best_of(func):
+        """Returns the best time of 'repeat' runs of 'func' over freshly parsed copies of the records"""
+        times = list()
+        for _ in range(args.repeat):
+            trees = [etree.fromstring(data) for data in records]
+            start = time.time()
+            for tree in trees:
+                func(tree)
+
+            times.append(time.time() - start)
+
+        return min(times)
+
+    parse = min(timeit.repeat(lambda: [etree.fromstring(data) for data in records], number=1, repeat=args.repeat))
+    legacy = best_of(lambda tree: legacy_apply(tree, 'computers'))
+    compiled = best_of(promoter.compile_manifest('computers').apply)
+    for name, elapsed in (('parse', parse), ('legacy', legacy), ('compiled', compiled)):
+        print('{:>8}: {:.3f}s for {} objects ({:.1f} us/object)'.format(
+            name, elapsed, args.objects, elapsed / args.objects * 1e6))
+
+    print('manifest application is {:.1f}x faster compiled'.format(legacy / compiled))
+    if not args.processes:
+        return
+
+    threads = ThreadPool(args.threads)
+    try:
+        in_threads = min(timeit.repeat(lambda: threads.map(
+            lambda data: etree.tostring(promoter.process_xml(data, 'computers')), records),
+            number=1, repeat=args.repeat))
+        with promoter.TransformPool(args.processes) as transforms:
+            threads.map(lambda data: transforms.transform(data, 'computers'), records[:args.processes])
+            in_processes = min(timeit.repeat(lambda: threads.map(
+                lambda data: transforms.transform(data, 'computers'), records), number=1, repeat=args.repeat))
+    finally:
+        threads.close()
+        threads.join()
+
+    for name, elapsed in (('threads', in_threads), ('processes', in_processes)):
+        print('{:>9}: {:.3f}s for {} objects ({:.1f} objects/s)'.format(
+            name, elapsed, args.objects, args.objects / elapsed))
+
+    print('{} processes are {:.1f}x the throughput of {} threads'.format(args.processes, in_threads / in_processes,
+                                                                         args.threads))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Benchmarks of promote_jss, clean_jss and process_xml against local mock JSS servers
+
+    python benchmarks/bench_promoter.py [--objects 50] [--workers 8] [--latency 0.02] [--error-rate 0.01]
+        [--targets 1] [--failing-targets 0]
+
+A source server with '--objects' objects of every resource and '--targets' empty target servers are started as separate
+processes (see mockjss.py) so their memory is not counted. promote_jss copies the source to the targets (each object is
+fetched and processed once however many targets there are), clean_jss empties the targets again and process_xml is timed
+over the computer records of the source. For each benchmark the objects per second, the p50 and p99 latency of the
+requests (or of each process_xml call) and the peak memory of the benchmark process are reported. Peak memory is the
+peak RSS of the process unless --tracemalloc is passed (Python 3) in which case it is the peak of the Python heap during
+the benchmark. The stats of the promote_jss pipeline (the time each queue was full or empty) follow promote_jss and the
+requests sent over the connections opened by the source and target JSS objects are reported last (pass --compress to
+gzip the bodies sent to the target). The last '--failing-targets' targets answer every write with a 500: promote_jss
+stops writing to them, carries on with the others and reports the error of each target after the pipeline stats.
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from manifests import resource_dependencies
+import jsslib
+from pipeline import format_stats
+import promoter
+
+__author__ = 'brysontyrrell'
+
+_mockjss = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mockjss.py')
+
+
+class LatencyJSS(jsslib.JSS):
+    """A JSS that keeps the latency of every request it sends"""
+    def __init__(self, *args, **kwargs):
+        """Initialize the LatencyJSS class"""
+        self.latencies = list()
+        super(LatencyJSS, self).__init__(*args, **kwargs)
+
+    def _send(self, method, url, **kwargs):
+        start = time.time()
+        try:
+            return super(LatencyJSS, self)._send(method, url, **kwargs)
+        finally:
+            self.latencies.append(time.time() - start)
+
+
+def start_server(*args):
+    """Starts mockjss.py in a new process and returns the process and the url of the server"""
+    process = subprocess.Popen([sys.executable, _mockjss, '--port', '0'] + [str(i) for i in args],
+                               stdout=subprocess.PIPE, universal_newlines=True)
+    return process, process.stdout.readline().strip()
+
+
+def percentile(values, percent):
+    """Returns a percentile of a list of values"""
+    values = sorted(values)
+    return values[int(round(percent / 100.0 * (len(values) - 1)))] if values else 0.0
+
+
+def peak_rss():
+    """Returns the peak resident set size of the process in bytes (0 where it cannot be read)"""
+    if resource is None:
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run(name, func, objects, latencies, use_tracemalloc):
+    """Runs a benchmark and prints its results"""
+    del latencies[:]
+    if use_tracemalloc:
+        tracemalloc.start()
+
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+    if use_tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    else:
+        peak = peak_rss()
+
+    print('{:>12}: {} objects in {:.2f}s ({:.1f} objects/s) latency p50 {:.2f}ms p99 {:.2f}ms peak memory '
+          '{:.1f} MB'.format(name, objects, elapsed, objects / elapsed, percentile(latencies, 50) * 1000,
+                             percentile(latencies, 99) * 1000, peak / 1048576.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--objects', type=int, default=50, help='objects of every resource on the source')
+    parser.add_argument('--applications', type=int, default=50, help='applications in each computer record')
+    parser.add_argument('--workers', type=int, default=8, help='workers passed to promote_jss and clean_jss')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the servers add to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 504')
+    parser.add_argument('--conflict-rate', type=float, default=0.0, help='fraction of writes answered with a 409')
+    parser.add_argument('--targets', type=int, default=1, help='target servers promote_jss writes to')
+    parser.add_argument('--failing-targets', type=int, default=0, help='targets that answer every write with a 500')
+    parser.add_argument('--processes', type=int, default=0, help='processes applying the manifests (0 for threads)')
+    parser.add_argument('--compress', action='store_true', help='gzip the bodies of POST and PUT requests')
+    parser.add_argument('--tracemalloc', action='store_true', help='report the peak of the Python heap')
+    args = parser.parse_args()
+    if args.tracemalloc and tracemalloc is None:
+        parser.error('--tracemalloc requires Python 3')
+
+    if not 0 <= args.failing_targets < args.targets:
+        parser.error('--failing-targets must leave at least one of the --targets working')
+
+    logging.disable(logging.CRITICAL)
+    options = ['--applications', args.applications, '--latency', args.latency, '--error-rate', args.error_rate,
+               '--conflict-rate', args.conflict_rate]
+    servers = [start_server('--objects', args.objects, *options)]
+    servers.extend(start_server('--empty', *options) for _ in range(args.targets - args.failing_targets))
+    servers.extend(start_server('--empty', '--fail-rate', 1, *options) for _ in range(args.failing_targets))
+    try:
+        source = LatencyJSS(servers[0][1], 'benchmark', 'benchmark', read_only=True, pool_maxsize=args.workers,
+                            return_bytes=True)
+        targets = [LatencyJSS(url, 'benchmark', 'benchmark', pool_maxsize=args.workers,
+                              compress_requests=args.compress) for server, url in servers[1:]]
+        total = args.objects * len(resource_dependencies)
+        latencies = list()
+        stats = list()
+
+        def reset():
+            for jss in [source] + targets:
+                del jss.latencies[:]
+
+        def promote():
+            stats.append(promoter.promote_jss(source, targets if len(targets) > 1 else targets[0],
+                                              workers=args.workers, processes=args.processes))
+            for jss in [source] + targets:
+                latencies.extend(jss.latencies)
+
+        def clean():
+            for jss in targets:
+                promoter.clean_jss(jss, workers=args.workers)
+                latencies.extend(jss.latencies)
+
+        reset()
+        run('promote_jss', promote, total, latencies, args.tracemalloc)
+        print(format_stats(stats[0]))
+        names = ['target{}'.format(n + 1) if len(targets) > 1 else 'target' for n in range(len(targets))]
+        for name, target in zip(names, stats[0]['targets']):
+            print('{:>12}: {}'.format(name, 'failed: {}'.format(target['error']) if target['error'] else 'ok'))
+
+        promoted = sum(len(getattr(jss, name)()) for name in resource_dependencies for jss in targets)
+        reset()
+        run('clean_jss', clean, promoted, latencies, args.tracemalloc)
+
+        records = [source.computers(i) for i in source.computers()]
+
+        def process():
+            for data in records:
+                start = time.time()
+                promoter.process_xml(data, 'computers')
+                latencies.append(time.time() - start)
+
+        run('process_xml', process, len(records), latencies, args.tracemalloc)
+        for name, jss in zip(['source'] + names, [source] + targets):
+            stats = jss.connection_stats()
+            print('{:>12}: {} requests over {} connections ({} reused)'.format(
+                name, stats['requests'], stats['connections'], stats['reused']))
+    finally:
+        for server, url in servers:
+            server.terminate()
+            server.wait()
+
+if __name__ == '__main__':
+    main()
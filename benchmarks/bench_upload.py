@@ -0,0 +1,76 @@
+"""
+Benchmark of the memory used to send large request bodies to a local mock JSS server
+
+    python benchmarks/bench_upload.py [--applications 20000] [--file-size 64] [--spool-size 1]
+
+An empty mock server is started as a separate process (see mockjss.py) so its memory is not counted. A computer record
+with '--applications' applications is POSTed as an element (serialized to a spooled temporary file of '--spool-size' MB
+and sent from it, see jsslib.UploadBody) and a file of '--file-size' MB is sent to /fileuploads with JSS.upload_file().
+For each the size of the body, the time taken and the peak of the Python heap while sending it (Python 3 tracemalloc)
+are reported - the peak stays about the same however large the body is.
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_process_xml import computer_xml
+from bench_promoter import start_server
+import jsslib
+import xmlbackend
+
+__author__ = 'brysontyrrell'
+
+
+def run(name, func, size):
+    """Runs a benchmark and prints its results"""
+    tracemalloc.start()
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('{:>12}: {:.1f} MB in {:.2f}s peak memory {:.1f} MB'.format(name, size / 1048576.0, elapsed,
+                                                                       peak / 1048576.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--applications', type=int, default=20000, help='applications in the computer record')
+    parser.add_argument('--file-size', type=int, default=64, help='MB of the uploaded file')
+    parser.add_argument('--spool-size', type=float, default=1, help='MB of a body kept in memory before a file')
+    args = parser.parse_args()
+    if tracemalloc is None:
+        parser.error('bench_upload.py requires Python 3')
+
+    logging.disable(logging.CRITICAL)
+    server, url = start_server('--empty')
+    try:
+        jss = jsslib.JSS(url, 'benchmark', 'benchmark', spool_size=int(args.spool_size * 1048576))
+        root = xmlbackend.fromstring(computer_xml(1, args.applications))
+        size = len(xmlbackend.tostring(root))
+        run('post', lambda: jss.computers(data=root), size)
+
+        with tempfile.TemporaryFile() as f:
+            block = os.urandom(1048576)
+            for _ in range(args.file_size):
+                f.write(block)
+
+            f.seek(0)
+            run('upload_file', lambda: jss.upload_file('computers', 1, f, filename='attachment.bin'),
+                args.file_size * 1048576)
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+"""
+A local stand-in for the JSS REST API for benchmarks and testing
+
+    python benchmarks/mockjss.py [--port 8080] [--objects 100] [--latency 0.05] [--error-rate 0.01] [--fail-rate 1]
+
+Serves the /JSSResource endpoints jsslib.JSS uses (/jssuser, the collections of every resource method and GET, POST,
+PUT and DELETE of objects by id or name, with /subset) from memory with basic authentication accepted for any user.
+Every resource starts with a synthetic inventory of '--objects' objects (use --empty for a target JSS). Each request
+is delayed by '--latency' seconds, fails with a 504 at '--error-rate' and writes fail with a 409 at '--conflict-rate'
+(objects with duplicate names are always rejected with a 409 the same way the JSS does) and with a 500 at
+'--fail-rate' (1 for a JSS that accepts no writes). Request bodies sent with
+'Content-Encoding: gzip' are decompressed. Files POSTed to /fileuploads are read in blocks and only their name, size
+and SHA-1 digest are kept (in MockJSS.uploads).
+
+The url of the server is printed on the first line of output once it is listening (use --port 0 for a free port).
+"""
+import argparse
+import hashlib
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import xml.etree.ElementTree as etree
+import zlib
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import unquote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_process_xml import computer_xml
+from jsslib import collections, subsets
+
+__author__ = 'brysontyrrell'
+
+_resources = dict((path, resource) for resource, (path, list_value) in collections.items())
+_groups = ('computer_groups', 'mobile_device_groups', 'user_groups')
+_upload_pattern = re.compile(r'^/JSSResource/fileuploads/([a-z]+)/(id|name)/([^/]+)/?$')
+_url_pattern = re.compile(r'^/JSSResource/([a-z]+)(?:/(id|name)/([^/]+))?(?:/subset/([^/]+))?/?$')
+
+
+def object_xml(resource, obj_id, applications=50):
+    """Returns the XML of a synthetic object for a resource"""
+    list_value = collections[resource][1]
+    name = '{}-{}'.format(list_value, obj_id)
+    if resource == 'computers':
+        root = etree.fromstring(computer_xml(obj_id, applications))
+        root.find('general/name').text = name
+        return etree.tostring(root)
+
+    root = etree.Element(list_value)
+    if resource in subsets:
+        general = etree.SubElement(root, 'general')
+        etree.SubElement(general, 'id').text = str(obj_id)
+        etree.SubElement(general, 'name').text = name
+        site = etree.SubElement(general, 'site')
+        etree.SubElement(site, 'id').text = '-1'
+        etree.SubElement(site, 'name').text = 'None'
+        for section, element in subsets[resource][1:]:
+            etree.SubElement(etree.SubElement(root, element), 'size').text = '0'
+    else:
+        etree.SubElement(root, 'id').text = str(obj_id)
+        etree.SubElement(root, 'name').text = name
+        if resource in _groups:
+            etree.SubElement(root, 'is_smart').text = 'true' if obj_id % 2 else 'false'
+
+    return etree.tostring(root)
+
+
+class Inventory(object):
+    """
+    The objects of every resource on a mock JSS
+        'objects' maps the id of every object of a resource to its XML and 'names' maps names to ids
+    """
+    def __init__(self, objects=100, applications=50):
+        """Initialize the Inventory class"""
+        self.lock = threading.Lock()
+        self.objects = dict((resource, dict()) for resource in collections)
+        self.names = dict((resource, dict()) for resource in collections)
+        self.next_id = objects + 1
+        for resource in collections:
+            for obj_id in range(1, objects + 1):
+                self.store(resource, obj_id, etree.fromstring(object_xml(resource, obj_id, applications)))
+
+    @staticmethod
+    def name(root):
+        """Returns the name of an object from its ElementTree.Element"""
+        return root.findtext('name') or root.findtext('general/name')
+
+    def store(self, resource, obj_id, root):
+        """Stores an object (replacing the object with the same id) after setting its id"""
+        parent = root.find('general') if root.find('general') is not None else root
+        element = parent.find('id')
+        if element is None:
+            element = etree.Element('id')
+            parent.insert(0, element)
+
+        element.text = str(obj_id)
+        self.remove(resource, obj_id)
+        self.objects[resource][obj_id] = etree.tostring(root)
+        self.names[resource][self.name(root)] = obj_id
+
+    def remove(self, resource, obj_id):
+        """Removes an object if it exists"""
+        xml = self.objects[resource].pop(obj_id, None)
+        if xml is not None:
+            self.names[resource].pop(self.name(etree.fromstring(xml)), None)
+
+    def find(self, resource, kind, value):
+        """Returns the id of an object by id or name or None if there is none"""
+        if kind == 'id':
+            obj_id = int(value)
+            return obj_id if obj_id in self.objects[resource] else None
+
+        return self.names[resource].get(value)
+
+    def collection(self, resource):
+        """Returns the XML of the collection of a resource"""
+        path, list_value = collections[resource]
+        ids = dict((obj_id, name) for name, obj_id in self.names[resource].items())
+        root = etree.Element(path)
+        etree.SubElement(root, 'size').text = str(len(ids))
+        for obj_id, name in sorted(ids.items()):
+            element = etree.SubElement(root, list_value)
+            etree.SubElement(element, 'id').text = str(obj_id)
+            etree.SubElement(element, 'name').text = name
+            if resource in _groups:
+                etree.SubElement(element, 'is_smart').text = etree.fromstring(
+                    self.objects[resource][obj_id]).findtext('is_smart')
+
+        return etree.tostring(root)
+
+
+class MockJSSHandler(BaseHTTPRequestHandler):
+    """Answers requests to the /JSSResource endpoints from the Inventory of the server"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+    def _respond(self, status, body=b''):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml;charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply(self, list_value, obj_id, status=201):
+        self._respond(status, '<{0}><id>{1}</id></{0}>'.format(list_value, obj_id).encode('utf-8'))
+
+    def _upload(self):
+        """Reads a multipart/form-data file upload in blocks and records the name, size and digest of the file"""
+        match = _upload_pattern.match(self.path)
+        boundary = self.headers.get('Content-Type', '').partition('boundary=')[2].encode('ascii')
+        remaining = int(self.headers.get('Content-Length') or 0)
+        head = b''
+        held = None
+        size = 0
+        digest = hashlib.sha1()
+        tail = len(b'\r\n--' + boundary + b'--\r\n')
+        while remaining:
+            block = self.rfile.read(min(remaining, 65536))
+            remaining -= len(block)
+            if held is None:
+                head += block
+                if b'\r\n\r\n' not in head:
+                    continue
+
+                head, _, block = head.partition(b'\r\n\r\n')
+                held = b''
+
+            held += block
+            if len(held) > tail:
+                digest.update(held[:-tail])
+                size += len(held) - tail
+                held = held[-tail:]
+
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            return self._respond(504, b'<html><body>Gateway Timeout</body></html>')
+
+        if match is None or not boundary:
+            return self._respond(400, b'<html><body>Bad Request</body></html>')
+
+        filename = re.search(b'filename="([^"]*)"', head)
+        with self.server.inventory.lock:
+            self.server.uploads.append((match.group(1), match.group(2), unquote(match.group(3)),
+                                        filename.group(1).decode('utf-8') if filename else None, size,
+                                        digest.hexdigest()))
+
+        return self._respond(201, b'<html><body>The resource was created successfully</body></html>')
+
+    def _handle(self, method):
+        server = self.server
+        if method == 'POST' and self.path.startswith('/JSSResource/fileuploads/'):
+            return self._upload()
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if server.error_rate and random.random() < server.error_rate:
+            return self._respond(504, b'<html><body>Gateway Timeout</body></html>')
+
+        if self.path == '/JSSResource/jssuser':
+            return self._respond(200, '<user><version>{}</version></user>'.format(server.version).encode('utf-8'))
+
+        match = _url_pattern.match(self.path)
+        resource = _resources.get(match.group(1)) if match else None
+        if resource is None:
+            return self._respond(404, b'<html><body>Not Found</body></html>')
+
+        list_value = collections[resource][1]
+        kind, value, subset = match.group(2), match.group(3), match.group(4)
+        inventory = server.inventory
+        with inventory.lock:
+            if kind is None:
+                if method != 'GET':
+                    return self._respond(405)
+
+                return self._respond(200, inventory.collection(resource))
+
+            if method in ('POST', 'PUT') and server.conflict_rate and random.random() < server.conflict_rate:
+                return self._respond(409, b'<html><body>Conflict</body></html>')
+
+            if method in ('POST', 'PUT') and server.fail_rate and random.random() < server.fail_rate:
+                return self._respond(500, b'<html><body>Internal Server Error</body></html>')
+
+            if method == 'POST':
+                root = etree.fromstring(body)
+                if inventory.find(resource, 'name', inventory.name(root)) is not None:
+                    return self._respond(409, b'<html><body>Duplicate name</body></html>')
+
+                obj_id = inventory.next_id
+                inventory.next_id += 1
+                inventory.store(resource, obj_id, root)
+                return self._reply(list_value, obj_id)
+
+            obj_id = inventory.find(resource, kind, unquote(value))
+            if obj_id is None:
+                return self._respond(404, b'<html><body>Not Found</body></html>')
+
+            if method == 'GET':
+                xml = inventory.objects[resource][obj_id]
+                if subset:
+                    keep = set(element for section, element in subsets.get(resource, [])
+                               if section in subset.split('&'))
+                    root = etree.fromstring(xml)
+                    for child in list(root):
+                        if child.tag not in keep:
+                            root.remove(child)
+
+                    xml = etree.tostring(root)
+
+                return self._respond(200, xml)
+            elif method == 'PUT':
+                root = etree.fromstring(body)
+                existing = inventory.find(resource, 'name', inventory.name(root))
+                if existing is not None and existing != obj_id:
+                    return self._respond(409, b'<html><body>Duplicate name</body></html>')
+
+                inventory.store(resource, obj_id, root)
+                return self._reply(list_value, obj_id)
+            else:
+                inventory.remove(resource, obj_id)
+                return self._reply(list_value, obj_id, 200)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+class MockJSS(ThreadingMixIn, HTTPServer):
+    """
+    A threaded HTTP server answering JSS REST API requests from an Inventory
+        serve_forever() runs the server - start() runs it on a daemon thread and returns the url
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, port=0, objects=100, applications=50, latency=0.0, error_rate=0.0, conflict_rate=0.0,
+                 version='9.81', fail_rate=0.0):
+        """Initialize the MockJSS class"""
+        HTTPServer.__init__(self, ('127.0.0.1', port), MockJSSHandler)
+        self.inventory = Inventory(objects, applications)
+        self.uploads = list()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.conflict_rate = conflict_rate
+        self.fail_rate = fail_rate
+        self.version = version
+
+    @property
+    def url(self):
+        """The url of the server (without /JSSResource)"""
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def start(self):
+        """Runs the server on a daemon thread and returns its url"""
+        thread = threading.Thread(target=self.serve_forever, name='mockjss')
+        thread.daemon = True
+        thread.start()
+        return self.url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on (0 for any free port)')
+    parser.add_argument('--objects', type=int, default=100, help='objects of every resource in the inventory')
+    parser.add_argument('--empty', action='store_true', help='start with no objects (a target JSS)')
+    parser.add_argument('--applications', type=int, default=50, help='applications in each computer record')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 504')
+    parser.add_argument('--conflict-rate', type=float, default=0.0, help='fraction of writes answered with a 409')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of writes answered with a 500')
+    args = parser.parse_args()
+
+    server = MockJSS(args.port, 0 if args.empty else args.objects, args.applications, args.latency, args.error_rate,
+                     args.conflict_rate, fail_rate=args.fail_rate)
+    print(server.url)
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
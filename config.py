@@ -9,5 +9,15 @@ config = {
         'url': 'https://target.jss.com',
         'username': '<api-username-here>',
         'password': '<api-password-here>'
+    },
+    'version_cache': None,
+    'promoter': {
+        'workers': 1,
+        'processes': 0,
+        'upsert': False,
+        'index_path': None,
+        'journal_path': None,
+        'resume': False,
+        'metrics_path': None
     }
 }
\ No newline at end of file
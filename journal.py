@@ -0,0 +1,135 @@
+"""An append-only record of the objects promoted to or cleaned from a JSS so an interrupted run can be resumed"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+__author__ = 'brysontyrrell'
+
+
+class Journal(object):
+    """
+    A journal of results stored in a SQLite database at 'path'
+
+    Each entry is the action ('promote' or 'clean'), the resource, the source id of the object, the id of the object
+        on the target JSS and its status ('done' or 'failed'). Entries are only ever appended: the latest entry for
+        an object is its result. An entry with the source id '*' marks a whole resource as done
+
+    record() only queues the entry - a background thread writes queued entries in batches so many worker threads
+        can record results without waiting on the database. flush() waits for everything queued to be written
+
+    sync_jss() keeps the target id and hash of every object it synced in a separate table (see synced() and
+        record_synced()) - written at once for each resource
+
+    The journal is kept between runs: remove() it to start over
+    """
+    resource_done = '*'
+
+    def __init__(self, path, batch_size=500):
+        """Initialize the Journal class"""
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                         'action TEXT, resource TEXT, source_id TEXT, target_id INTEGER, status TEXT, recorded REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_object ON entries (action, resource, source_id)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS synced ('
+                         'resource TEXT, name TEXT, target_id INTEGER, hash TEXT, PRIMARY KEY (resource, name))')
+        self._db.commit()
+        self._queue = Queue()
+        self._writer = threading.Thread(target=self._write_entries, name='journal-writer')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def _write_entries(self):
+        """Writes queued entries in batches until None is queued"""
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not None and len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get())
+
+            entries = [entry for entry in batch if entry is not None]
+            try:
+                if entries:
+                    with self._lock:
+                        self._db.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)', entries)
+                        self._db.commit()
+            except sqlite3.Error as e:
+                logging.error("unable to write {} journal entries: {}".format(len(entries), e))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+            if batch[-1] is None:
+                return
+
+    def record(self, action, resource, source_id, target_id=None, status='done'):
+        """Queues an entry for an object"""
+        self._queue.put((action, resource, str(source_id), target_id, status, time.time()))
+
+    def record_resource(self, action, resource):
+        """Queues an entry marking all objects of a resource as done"""
+        self.record(action, resource, self.resource_done)
+
+    def flush(self):
+        """Waits for all queued entries to be written"""
+        self._queue.join()
+
+    def completed(self, action, resource):
+        """Returns a dictionary of the source ids of the objects that are done to their target ids"""
+        self.flush()
+        with self._lock:
+            rows = self._db.execute('SELECT source_id, target_id, status FROM entries '
+                                    'WHERE action = ? AND resource = ? ORDER BY rowid', (action, resource)).fetchall()
+
+        results = dict()
+        for source_id, target_id, status in rows:
+            if status == 'done':
+                results[source_id] = target_id
+            else:
+                results.pop(source_id, None)
+
+        return results
+
+    def resource_completed(self, action, resource):
+        """Tests if all objects of a resource are done"""
+        return self.resource_done in self.completed(action, resource)
+
+    def synced(self, resource):
+        """Returns a dictionary of the names of the objects of a resource last synced to their target ids and hashes"""
+        with self._lock:
+            rows = self._db.execute('SELECT name, target_id, hash FROM synced WHERE resource = ?',
+                                    (resource,)).fetchall()
+
+        return dict((name, (target_id, digest)) for name, target_id, digest in rows)
+
+    def record_synced(self, resource, objects):
+        """Replaces the synced objects of a resource with a dictionary of their names to target ids and hashes"""
+        with self._lock:
+            self._db.execute('DELETE FROM synced WHERE resource = ?', (resource,))
+            self._db.executemany('INSERT INTO synced VALUES (?, ?, ?, ?)', [
+                (resource, name, target_id, digest) for name, (target_id, digest) in objects.items()])
+            self._db.commit()
+
+    def close(self):
+        """Writes the queued entries and closes the database"""
+        self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            self._db.close()
+
+
+def remove(path):
+    """Deletes the journal at 'path' (and the write-ahead log SQLite keeps next to it) if it exists"""
+    for i in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(i):
+            os.remove(i)
@@ -1,70 +1,308 @@
 """A simple wrapper for the JSS REST API"""
+from email.utils import mktime_tz, parsedate_tz
+import io
+import json
 import logging
+from metrics import Metrics
+import os
+import random
+import re
 import requests
-import xml.etree.ElementTree as etree
+from requests.adapters import HTTPAdapter
+import tempfile
+import threading
+import time
+import uuid
+import xmlbackend
+import zlib
+
+try:
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote
 
 __author__ = 'brysontyrrell'
 __version__ = '1.0'
 
+# A file to cache the versions of JSS servers in between runs (by url) - pass it as 'version_cache' to JSS
+default_version_cache = os.path.join(os.path.expanduser('~'), '.jsslib_versions.json')
+_version_cache_lock = threading.Lock()
+
 
-class JSS(object):
+class RetryPolicy(object):
     """
-    An object for interacting with the JSS REST API
+    Controls how failed requests to the JSS REST API are retried
 
-    set 'read_only' to True to only allow GET requests with the API
-        calls to POST, PUT and DELETE will return a None value
+    'retries' is a dictionary of HTTP methods and the number of times a failed request will be retried
+        the values passed are merged with the defaults - set a method to 0 to disable retries for it
+        GET, PUT and DELETE requests are safe to repeat
+        POST requests are only repeated after checking the JSS for an object with the same name (see JSS._post)
 
-    set 'return_json' to True to have GET requests return JSON instead of XML
-        the JSS API can only accept XML for POST and PUT requests
+    Requests are retried after connection errors, timeouts and responses with a status code in 'status_codes'
 
-    The HTTP method is inferred by the values passed to the resource
+    The delay between attempts is an exponential backoff with full jitter:
+        a random value between 0 and 'backoff_factor' * 2 ^ attempt capped at 'max_backoff' seconds
+        a 'Retry-After' header on a 429 or 503 response is honored in place of the backoff (also capped)
+    """
+    default_retries = {'GET': 5, 'PUT': 3, 'POST': 3, 'DELETE': 5}
 
-        GET: provide no value for 'id_name' or pass an integer (id) or string (name)
-        POST: provide 'data' in string format or an ElementTree.Element object
-        PUT: provide a value for 'id_name" and 'data' in string format or an ElementTree.Element object
-        DELETE: provide a value for 'id_name' and pass 'delete=True'
+    def __init__(self, retries=None, backoff_factor=0.5, max_backoff=60, status_codes=(429, 500, 502, 503, 504)):
+        """Initialize the RetryPolicy class"""
+        self.retries = dict(self.default_retries)
+        self.retries.update(retries or {})
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.status_codes = status_codes
 
-    TODO:
-    _update_only_object()
-        Objects that only support GET, PUT requests
-        /activationcode
-        /byoprofiles
-        /computercheckin
-        /gsxconenction
-        /smtpserver
+    def should_retry(self, method, attempt, status_code=None):
+        """Returns True if a request that has failed 'attempt' + 1 times should be sent again"""
+        if attempt >= self.retries.get(method, 0):
+            return False
 
-    _invitation_object()
-        Invitations support GET, POST, DELETE requests
-        /computerinvitations
-        /mobiledeviceinvitations
+        return status_code is None or status_code in self.status_codes
+
+    @staticmethod
+    def _retry_after(headers):
+        """Returns the number of seconds requested by a 'Retry-After' header (in seconds or as an HTTP date)"""
+        value = headers.get('Retry-After') if headers is not None else None
+        if not value:
+            return None
 
-    _file_upload()
-        Need to design use of this endpoint - add-on to existing methods that support fileupload?
-        /fileupload
+        try:
+            return max(0, int(value))
+        except ValueError:
+            date = parsedate_tz(value)
+            return max(0, mktime_tz(date) - time.time()) if date else None
 
-    _subset_object()
-        Build subset support for objects that support it
+    def backoff(self, attempt, status_code=None, headers=None):
+        """Returns the number of seconds to wait before the next attempt"""
+        if status_code in (429, 503):
+            retry_after = self._retry_after(headers)
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
 
-    Add objects that are not implemented
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
 
-    Add exceptions
+
+class UploadBody(object):
     """
-    def __init__(self, url, username, password, read_only=False, return_json=False):
-        """Initialize the JSS class"""
-        self._session = requests.Session()
-        self._session.auth = (username, password)
+    The body of a request read from a list of parts (bytes and file objects opened in binary mode) as it is sent
+        File objects are read from the position they are at when the UploadBody is created, in blocks, so a body
+        never has to be held in memory in one piece. len() is the size of the body (the request is sent with a
+        Content-Length) and rewind() moves every part back to its start so a retried request sends the whole body
+        again. close() closes the parts
+    """
+    block_size = 65536
+
+    def __init__(self, parts):
+        """Initialize the UploadBody class"""
+        self._parts = list()
+        self._size = 0
+        for part in parts:
+            if isinstance(part, type(u'')):
+                part = part.encode('utf-8')
+
+            if isinstance(part, bytes):
+                part = io.BytesIO(part)
+
+            start = part.tell()
+            part.seek(0, os.SEEK_END)
+            self._size += part.tell() - start
+            part.seek(start)
+            self._parts.append((part, start))
+
+        self._index = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        block = self.read(self.block_size)
+        while block:
+            yield block
+            block = self.read(self.block_size)
+
+    def read(self, size=-1):
+        """Returns up to 'size' bytes of the body (all that is left if 'size' is negative) - b'' at the end"""
+        blocks = list()
+        while self._index < len(self._parts) and size != 0:
+            block = self._parts[self._index][0].read(size)
+            if not block:
+                self._index += 1
+                continue
+
+            blocks.append(block)
+            if size > 0:
+                size -= len(block)
+
+        return b''.join(blocks)
+
+    def rewind(self):
+        """Moves every part back to its start"""
+        for part, start in self._parts:
+            part.seek(start)
+
+        self._index = 0
+
+    def close(self):
+        """Closes every part"""
+        for part, start in self._parts:
+            part.close()
+
+
+# The endpoints of the JSS REST API behind each resource method of BaseJSS: (url path, list element of the collection,
+#   kind, first version, last version) - the kind is 'standard', 'group' (a 'group_filter' argument) or 'subset' (a
+#   'subset' argument, see subsets) and a version of None is not bounded
+endpoints = {
+    'buildings': ('buildings', 'building', 'standard', '9.0', None),
+    'categories': ('categories', 'category', 'standard', '9.0', None),
+    'computers': ('computers', 'computer', 'subset', '9.0', None),
+    'computer_extension_attributes': ('computerextensionattributes',
+                                      'computer_extension_attribute', 'standard', '9.0', None),
+    'computer_groups': ('computergroups', 'computer_group', 'group', '9.0', None),
+    'departments': ('departments', 'department', 'standard', '9.0', None),
+    'ebooks': ('ebooks', 'ebook', 'subset', '9.4', None),
+    'ibeacons': ('ibeacons', 'ibeacon', 'standard', '9.3', None),
+    'ldap_servers': ('ldapservers', 'ldap_server', 'standard', '9.0', None),
+    'mac_applications': ('macapplications', 'mac_application', 'subset', '9.4', None),
+    'mobile_device_applications': ('mobiledeviceapplications', 'mobile_device_application', 'subset', '9.0', None),
+    'mobile_device_configuration_profiles': ('mobiledeviceconfigurationprofiles',
+                                             'configuration_profile', 'subset', '9.0', None),
+    'mobile_device_extension_attributes': ('mobiledeviceextensionattributes',
+                                           'mobile_device_extension_attribute', 'standard', '9.0', None),
+    'mobile_device_groups': ('mobiledevicegroups', 'mobile_device_group', 'group', '9.0', None),
+    'mobile_devices': ('mobiledevices', 'mobile_device', 'subset', '9.0', None),
+    'network_segments': ('networksegments', 'network_segment', 'standard', '9.0', None),
+    'os_x_configuration_profiles': ('osxconfigurationprofiles', 'os_x_configuration_profile', 'subset', '9.0', None),
+    'packages': ('packages', 'package', 'standard', '9.0', None),
+    'peripherals': ('peripherals', 'peripheral', 'standard', '9.0', None),
+    'peripheral_types': ('peripheraltypes', 'peripheral_type', 'standard', '9.0', None),
+    'policies': ('policies', 'policy', 'subset', '9.0', None),
+    'printers': ('printers', 'printer', 'standard', '9.0', None),
+    'scripts': ('scripts', 'script', 'standard', '9.0', None),
+    'user_extension_attributes': ('userextensionattributes', 'user_extension_attribute', 'standard', '9.0', None),
+    'user_groups': ('usergroups', 'user_group', 'group', '9.0', None),
+    'users': ('users', 'user', 'standard', '9.0', None)
+}
+
+
+# The url path and list element of the collection for each resource method
+collections = dict((resource, endpoint[:2]) for resource, endpoint in endpoints.items())
+
+
+# The sections that can be requested from /subset (and the XML element of each) for the resources that support it
+subsets = {
+    'computers': [('General', 'general'), ('Location', 'location'), ('Purchasing', 'purchasing'),
+                  ('Peripherals', 'peripherals'), ('Hardware', 'hardware'), ('Certificates', 'certificates'),
+                  ('Software', 'software'), ('ExtensionAttributes', 'extension_attributes'),
+                  ('GroupsAccounts', 'groups_accounts'), ('iphones', 'iphones'),
+                  ('ConfigurationProfiles', 'configuration_profiles')],
+    'ebooks': [('General', 'general'), ('Scope', 'scope'), ('SelfService', 'self_service'),
+               ('VPPCodes', 'vpp_codes')],
+    'mac_applications': [('General', 'general'), ('Scope', 'scope'), ('SelfService', 'self_service'),
+                         ('VPPCodes', 'vpp_codes'), ('VPP', 'vpp')],
+    'mobile_device_applications': [('General', 'general'), ('Scope', 'scope'), ('SelfService', 'self_service'),
+                                   ('VPPCodes', 'vpp_codes'), ('VPP', 'vpp'),
+                                   ('AppConfiguration', 'app_configuration')],
+    'mobile_device_configuration_profiles': [('General', 'general'), ('Scope', 'scope')],
+    'mobile_devices': [('General', 'general'), ('Location', 'location'), ('Purchasing', 'purchasing'),
+                       ('Applications', 'applications'), ('Security', 'security'), ('Network', 'network'),
+                       ('Certificates', 'certificates'), ('ConfigurationProfiles', 'configuration_profiles'),
+                       ('ProvisioningProfiles', 'provisioning_profiles'),
+                       ('MobileDeviceGroups', 'mobile_device_groups'), ('ExtensionAttributes', 'extension_attributes')],
+    'os_x_configuration_profiles': [('General', 'general'), ('Scope', 'scope'), ('SelfService', 'self_service')],
+    'policies': [('General', 'general'), ('Scope', 'scope'), ('SelfService', 'self_service'),
+                 ('PackageConfiguration', 'package_configuration'), ('Scripts', 'scripts'), ('Printers', 'printers'),
+                 ('DockItems', 'dock_items'), ('AccountMaintenance', 'account_maintenance'), ('Reboot', 'reboot'),
+                 ('Maintenance', 'maintenance'), ('FilesProcesses', 'files_processes'),
+                 ('UserInteraction', 'user_interaction'), ('DiskEncryption', 'disk_encryption')]
+}
+
+
+# The url path under /fileuploads for each kind of file that can be uploaded (see JSS.upload_file()) - the kind is the
+#   resource method of the object the file is attached to ('mobile_device_application_ipas' is the app itself and
+#   'mobile_device_applications' its icon)
+file_uploads = {
+    'computers': 'computers',
+    'ebooks': 'ebooks',
+    'mobile_device_applications': 'mobiledeviceapplicationsicon',
+    'mobile_device_application_ipas': 'mobiledeviceapplicationsipa',
+    'mobile_devices': 'mobiledevices',
+    'peripherals': 'peripherals',
+    'policies': 'policies',
+    'printers': 'printers'
+}
+
+
+def parse_version(version):
+    """Returns a version string ('9.81', '9.101.0-t1504998263') as a tuple of integers to compare, or None"""
+    if not version:
+        return None
+
+    return tuple(int(i) for i in re.findall(r'\d+', version.split('-')[0]))
+
+
+def read_version_cache(path, url, max_age=86400):
+    """
+    Returns the version of the JSS at 'url' from a version cache file, or None if it is missing, too old or not in
+        the format write_version_cache() writes
+    """
+    try:
+        with open(path) as f:
+            entry = json.load(f).get(url)
+
+        if not entry or time.time() - entry['checked'] > max_age:
+            return None
+
+        return entry['version']
+    except (IOError, OSError, ValueError, AttributeError, KeyError, TypeError):
+        return None
+
+
+def write_version_cache(path, url, version):
+    """Stores the version of the JSS at 'url' in a version cache file (failures are logged and ignored)"""
+    with _version_cache_lock:
+        try:
+            with open(path) as f:
+                cache = json.load(f)
+        except (IOError, OSError, ValueError):
+            cache = dict()
+
+        if not isinstance(cache, dict):
+            cache = dict()
+
+        cache[url] = {'version': version, 'checked': time.time()}
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(cache, f, indent=2, sort_keys=True)
+
+            os.rename(temp_path, path)
+        except (IOError, OSError) as e:
+            logging.warning("unable to write the version cache {}: {}".format(path, e))
+
+
+class BaseJSS(object):
+    """
+    The URL construction, XML parsing and resource methods shared by JSS and asyncjsslib.AsyncJSS
+
+    Subclasses provide _get(), _post(), _put() and _delete() - the resource methods return whatever those return
+        (values for JSS and coroutines for AsyncJSS)
+
+    The resource methods are generated from the endpoints table. Calling one for a resource the version of the JSS
+        does not support raises an exception without sending a request - check with supports() first
+    """
+    _metrics = None
+    version = None
+
+    def __init__(self, url, read_only=False, return_json=False, retry=None):
+        """Initialize the BaseJSS class"""
         self._url = '{}/JSSResource'.format(url)
         self._read_only = read_only
-        self.version = self._get_version()
+        self._retry = retry if retry is not None else RetryPolicy()
         self._content_header = {"Content-Type": "text/xml"}
         self._accept_header = {"Accept": "application/xml"} if not return_json else {"Accept": "application/json"}
 
-    def _get_version(self):
-        """Returns the version of the JSS (uses deprecated API)"""
-        resp = self._session.get('{}/jssuser'.format(self._url))
-        resp.raise_for_status()
-        return etree.fromstring(resp.text).findtext('version')
-
     @staticmethod
     def _is_int(value):
         """Tests a value to determine if it should be treated as an integer or string"""
@@ -80,274 +318,757 @@ class JSS(object):
     @staticmethod
     def _return_list(xml, list_value):
         """Returns a list of ids for a collection"""
-        id_list = [int(i.findtext('id')) for i in etree.fromstring(xml).findall(list_value)]
+        id_list = [int(i.findtext('id')) for i in xmlbackend.fromstring(xml).findall(list_value)]
         id_list.sort()
         return id_list
 
+    @staticmethod
+    def _return_name_map(xml, list_value):
+        """
+        Returns a dictionary of object names to ids (as integers) for a collection
+            objects that share a name are logged - the name maps to the last of them
+        """
+        names = dict()
+        for i in xmlbackend.fromstring(xml).findall(list_value):
+            name, obj_id = i.findtext('name'), int(i.findtext('id'))
+            if name in names:
+                logging.warning("the {} objects {} and {} have the same name '{}': only {} can be found by name".format(
+                    list_value, names[name], obj_id, name, obj_id))
+
+            names[name] = obj_id
+
+        return names
+
     @staticmethod
     def _return_group_list_filtered(xml, list_value, group_filter):
         """Returns a list of ids for a group collection with an optional filter for only 'smart' and 'static'"""
         id_list = list()
-        # It can be assumed that the only other possible value is 'static' - see _get()
+        # It can be assumed that the only other possible value is 'static' - see _group_object()
         match = 'true' if group_filter == 'smart' else 'false'
-        for i in etree.fromstring(xml).findall(list_value):
+        for i in xmlbackend.fromstring(xml).findall(list_value):
             if i.findtext('is_smart') == match:
                 id_list.append(int(i.findtext('id')))
 
         id_list.sort()
         return id_list
 
+    @staticmethod
+    def _iter_list(source, list_value, group_filter=None):
+        """
+        Yields the ids (as integers) of a collection as they are parsed from a file object
+            'group_filter' is applied the same as in _return_group_list_filtered()
+            each list entry is cleared once its id has been read so memory use does not grow with the collection
+        """
+        match = None if group_filter is None else 'true' if group_filter == 'smart' else 'false'
+        root = None
+        depth = 0
+        for event, element in xmlbackend.iterparse(source, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth == 1:
+                if element.tag == list_value and (match is None or element.findtext('is_smart') == match):
+                    yield int(element.findtext('id'))
+
+                root.clear()
+
     @staticmethod
     def _element_check(data):
-        """Checks if a value is an xml.etree.ElementTree.Element object and returns a string"""
-        if isinstance(data, etree.Element):
+        """Checks if a value is an element (see xmlbackend) and returns it serialized to bytes"""
+        if xmlbackend.iselement(data):
             logging.debug("attempting to convert to xml string")
-            return etree.tostring(data)
+            return xmlbackend.tostring(data)
         else:
             return data
 
+    @staticmethod
+    def _log_data(data):
+        """Logs the body of a request - it is only formatted (or an element serialized) when DEBUG is enabled"""
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug('DATA: {}'.format(xmlbackend.tostring(data) if xmlbackend.iselement(data) else data))
+
+    @staticmethod
+    def _object_name(data):
+        """Returns the name of an object from its XML (a string, bytes or an element - see xmlbackend)"""
+        root = xmlbackend.fromstring(data) if not xmlbackend.iselement(data) else data
+        return root.findtext('name') or root.findtext('general/name')
+
+    @staticmethod
+    def _parse_id(xml):
+        """Returns the id from the XML of an object or the response to a POST, PUT or DELETE"""
+        root = xmlbackend.fromstring(xml)
+        return root.findtext('id') or root.findtext('general/id')
+
+    @staticmethod
+    def _parse_version(xml):
+        """Returns the version from the response of the /jssuser endpoint"""
+        return xmlbackend.fromstring(xml).findtext('version')
+
+    def _parse_get(self, xml, list_value=None, group_filter=None):
+        """Returns a list of ids (as integers) for a collection or the string (xml text) for single objects"""
+        if list_value and group_filter is None:
+            logging.debug("returning id list for collection")
+            return self._return_list(xml, list_value)
+        elif list_value and group_filter:
+            logging.debug("returning filtered list of ids for group collection")
+            return self._return_group_list_filtered(xml, list_value, group_filter)
+        else:
+            return xml
+
+    def supports(self, resource):
+        """
+        Tests if the JSS supports a resource method (see jsslib.endpoints)
+            every resource in the table is treated as supported while the version of the JSS is not known
+        """
+        if resource not in endpoints:
+            return False
+
+        first, last = endpoints[resource][3:]
+        version = parse_version(self.version)
+        if version is None:
+            return True
+
+        return (first is None or version >= parse_version(first)) and (last is None or version <= parse_version(last))
+
+    def names(self, resource):
+        """Returns a dictionary of object names to ids (as integers) for a resource, e.g. names('computers')"""
+        self._check_supported(resource)
+        path, list_value = collections[resource]
+        return self._return_name_map(self._get('{}/{}'.format(self._url, path)), list_value)
+
     def _append_id_name(self, url, value):
         """Appends '/id/value' or '/name/value' to a url"""
         return '{}/id/{}'.format(url, value) if self._is_int(value) else '{}/name/{}'.format(url, value)
 
+    def _resolve(self, id_name, data, delete, path, list_value, group_filter=None):
+        """Returns the request method (_get, _post, _put or _delete) and its arguments for a call to a resource"""
+        obj_url = '{}/{}'.format(self._url, path)
+        # Elements are tested with iselement() - the truth value of an element is the number of its children
+        has_data = xmlbackend.iselement(data) or bool(data)
+        if not (id_name or has_data or delete):
+            return self._get, (obj_url, list_value, group_filter)
+        elif has_data and not (id_name or delete):
+            return self._post, (obj_url, data)
+        else:
+            obj_url = self._append_id_name(obj_url, id_name)
+            if id_name and not (has_data or delete):
+                return self._get, (obj_url,)
+            elif id_name and has_data and not delete:
+                return self._put, (obj_url, data)
+            elif id_name and delete and not has_data:
+                return self._delete, (obj_url,)
+            else:
+                raise Exception
+
+    def _standard_object(self, **kwargs):
+        """Method for interacting with most objects"""
+        method, args = self._resolve(**kwargs)
+        return method(*args)
+
+    def _group_object(self, **kwargs):
+        """Method for interacting with group objects"""
+        if kwargs['group_filter'] not in ('smart', 'static', None):
+            logging.debug("invalid filter: must be 'smart', 'static' or None")
+            raise Exception
+
+        method, args = self._resolve(**kwargs)
+        return method(*args)
+
+    def _subset_object(self, resource, subset, **kwargs):
+        """
+        Method for interacting with objects that support subsets
+            'subset' is a list of section names (see jsslib.subsets) or a string of names joined by '&' - only those
+            sections of the object are requested: /JSSResource/path/id/1/subset/General&Location
+        """
+        method, args = self._resolve(**kwargs)
+        if subset:
+            sections = subset.split('&') if hasattr(subset, 'split') else list(subset)
+            valid = [name for name, element in subsets[resource]]
+            if not (method == self._get and len(args) == 1) or [i for i in sections if i not in valid]:
+                logging.debug("invalid subset: must be a GET of one object and any of: {}".format(', '.join(valid)))
+                raise Exception
+
+            args = ('{}/subset/{}'.format(args[0], '&'.join(sections)),)
+
+        return method(*args)
+
+    def _check_supported(self, resource):
+        """Raises an exception for a resource the version of the JSS does not support (before any request is sent)"""
+        if not self.supports(resource):
+            logging.debug("/{} is not supported by JSS version {}".format(endpoints[resource][0], self.version))
+            raise Exception
+
+
+def _resource_method(resource):
+    """Returns the BaseJSS method for a resource in the endpoints table"""
+    path, list_value, kind = endpoints[resource][:3]
+    if kind == 'group':
+        def method(self, id_name=None, data=None, delete=False, group_filter=None):
+            self._check_supported(resource)
+            return self._group_object(id_name=id_name, data=data, delete=delete, path=path, list_value=list_value,
+                                      group_filter=group_filter)
+
+        argument = "group_filter: 'smart', 'static' or None"
+    elif kind == 'subset':
+        def method(self, id_name=None, data=None, delete=False, subset=None):
+            self._check_supported(resource)
+            return self._subset_object(resource, subset, id_name=id_name, data=data, delete=delete, path=path,
+                                       list_value=list_value)
+
+        argument = 'subset: a list of sections to GET (see jsslib.subsets) or None'
+    else:
+        def method(self, id_name=None, data=None, delete=False):
+            self._check_supported(resource)
+            return self._standard_object(id_name=id_name, data=data, delete=delete, path=path, list_value=list_value)
+
+        argument = None
+
+    method.__name__ = str(resource)
+    method.__doc__ = '/JSSResource/{}'.format(path)
+    if argument:
+        method.__doc__ = '\n        {}\n            {}\n        '.format(method.__doc__, argument)
+
+    return method
+
+
+for _resource in endpoints:
+    setattr(BaseJSS, _resource, _resource_method(_resource))
+
+del _resource
+
+
+class ReadOnlyJSS(BaseJSS):
+    """
+    A store of JSS objects that answers the GET requests of the resource methods in place of a live JSS (see
+        snapshots.Snapshot and archives.Archive)
+
+    POST, PUT and DELETE requests return None as for a read_only JSS so a ReadOnlyJSS can be passed to
+        promoter.promote_jss in place of a live source JSS. Subclasses provide _get() and raise a KeyError for
+        anything they do not hold
+    """
+    def __init__(self):
+        """Initialize the ReadOnlyJSS class"""
+        super(ReadOnlyJSS, self).__init__('', read_only=True)
+
+    def _write(self, url, xml=None):
+        """POST, PUT and DELETE requests return None"""
+        logging.info("api read_only is enabled")
+        return None
+
+    _post = _put = _delete = _write
+
+
+class JSS(BaseJSS):
+    """
+    An object for interacting with the JSS REST API
+
+    set 'read_only' to True to only allow GET requests with the API
+        calls to POST, PUT and DELETE will return a None value
+
+    set 'return_json' to True to have GET requests return JSON instead of XML
+        the JSS API can only accept XML for POST and PUT requests
+
+    set 'return_bytes' to True to have GET requests for objects return the body of the response as bytes instead of
+        decoding it to text - promoter parses the bytes as they are (collections are always parsed from bytes)
+
+    The HTTP method is inferred by the values passed to the resource
+
+        GET: provide no value for 'id_name' or pass an integer (id) or string (name)
+        POST: provide 'data' as a string, bytes or an element (an lxml.etree or xml.etree.ElementTree element - see
+            xmlbackend)
+        PUT: provide a value for 'id_name" and 'data' the same as for POST
+        DELETE: provide a value for 'id_name' and pass 'delete=True'
+
+    A JSS object can be shared between threads: each thread is given its own requests.Session on first use
+
+    Failed requests are retried according to 'retry' (a RetryPolicy) - the default policy is used if none is passed
+
+    set 'stream_lists' to True to have GET requests for a collection return a generator of ids
+        ids are parsed from the response as it is downloaded and are yielded in the order the JSS returns them
+        (lists are sorted otherwise) - memory use and the time to the first id do not grow with the collection
+
+    pass a snapshots.Snapshot as 'snapshot' to read through it: GET requests are answered from the snapshot when
+        possible and the responses to the others are stored in it (collections are not streamed)
+
+    Every request is recorded in a metrics.Metrics object (pass one as 'metrics' to share it between JSS objects):
+        metrics() returns the counts, status codes, latency, bytes and XML parse time by resource path
+
+    Connections are kept in one pool shared by the sessions of all threads:
+        'pool_connections' is the number of hosts pooled and 'pool_maxsize' the connections kept open to each host
+        (size it to the number of threads using the JSS object - connections over the limit are closed after use
+        unless 'pool_block' is True, in which case threads wait for a free connection)
+        set 'keep_alive' to False to close every connection after its request
+        'timeout' is the seconds to wait to connect and for a response: one number or a (connect, read) tuple
+        connection_stats() returns the connections opened and the requests sent over them
+
+    The version of the JSS is read on first use (see supports()). Pass the path of a file as 'version_cache' (e.g.
+        jsslib.default_version_cache) to keep it there by url for 'version_max_age' seconds so later runs do not
+        request it - no file is used by default
+
+    Pass a responsecache.ResponseCache as 'cache' to answer repeated GET requests from memory (e.g. the same
+        collection listed with different 'group_filter' values). POST, PUT and DELETE requests invalidate the cached
+        responses of their resource and cache_stats() returns the hits and misses. Streamed collections and requests
+        answered from 'snapshot' are not cached
+
+    Responses are requested with gzip or deflate compression. Set 'compress_requests' to True to gzip the bodies of
+        POST and PUT requests of at least 'compress_min_size' bytes (the JSS must accept 'Content-Encoding: gzip')
+
+    Objects passed as elements are serialized straight to a temporary file for POST and PUT requests (kept in memory
+        up to 'spool_size' bytes) and sent from it in blocks (see UploadBody) - as is the gzipped body with
+        'compress_requests'. upload_file() sends a file to /fileuploads the same way
+
+    TODO:
+    _update_only_object()
+        Objects that only support GET, PUT requests
+        /activationcode
+        /byoprofiles
+        /computercheckin
+        /gsxconenction
+        /smtpserver
+
+    _invitation_object()
+        Invitations support GET, POST, DELETE requests
+        /computerinvitations
+        /mobiledeviceinvitations
+
+    Add objects that are not implemented
+
+    Add exceptions
+    """
+    def __init__(self, url, username, password, read_only=False, return_json=False, retry=None, stream_lists=False,
+                 snapshot=None, metrics=None, pool_connections=10, pool_maxsize=32, pool_block=False, keep_alive=True,
+                 timeout=(10, 300), compress_requests=False, compress_min_size=1024,
+                 version_cache=None, version_max_age=86400, return_bytes=False, cache=None,
+                 spool_size=1048576):
+        """Initialize the JSS class"""
+        super(JSS, self).__init__(url, read_only=read_only, return_json=return_json, retry=retry)
+        self._auth = (username, password)
+        self._local = threading.local()
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                    pool_block=pool_block)
+        self._keep_alive = keep_alive
+        self._timeout = timeout
+        self._compress_requests = compress_requests
+        self._compress_min_size = compress_min_size
+        self._spool_size = spool_size
+        self._version_cache = version_cache
+        self._version_max_age = version_max_age
+        self._version_lock = threading.Lock()
+        self._version = None
+        self._stream_lists = stream_lists
+        self._return_bytes = return_bytes
+        self.snapshot = snapshot
+        self.cache = cache
+        self._metrics = metrics if metrics is not None else Metrics()
+
+    @property
+    def version(self):
+        """
+        The version of the JSS - read on first use from 'snapshot', the version cache or the /jssuser endpoint (in
+            that order) so creating a JSS object sends no requests
+        """
+        if self._version is None:
+            with self._version_lock:
+                if self._version is None:
+                    self._version = self._read_version()
+
+        return self._version
+
+    @version.setter
+    def version(self, value):
+        self._version = value
+
+    def _read_version(self):
+        """Returns the version of the JSS from the snapshot, the version cache or the JSS and caches it"""
+        if self.snapshot is not None and self.snapshot.version:
+            return self.snapshot.version
+
+        if self._version_cache:
+            version = read_version_cache(self._version_cache, self._url, self._version_max_age)
+            if version:
+                logging.debug("read the version of {} from the version cache: {}".format(self._url, version))
+                return version
+
+        version = self._get_version()
+        if self._version_cache and version:
+            write_version_cache(self._version_cache, self._url, version)
+
+        return version
+
+    @property
+    def _session(self):
+        """Returns the requests.Session for the current thread"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            logging.debug("creating session for thread: {}".format(threading.current_thread().name))
+            session = requests.Session()
+            session.auth = self._auth
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            session.headers['Accept-Encoding'] = 'gzip, deflate'
+            if not self._keep_alive:
+                session.headers['Connection'] = 'close'
+
+            self._local.session = session
+
+        return session
+
+    def connection_stats(self):
+        """
+        Returns a dictionary of the use of the connection pool:
+            'connections': connections opened
+            'requests': requests sent
+            'reused': requests sent over a connection that was already open
+            'idle': open connections waiting in the pool
+            with 'keep_alive' False every request opens a connection
+        """
+        stats = dict(connections=0, requests=0, reused=0, idle=0)
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+
+            stats['connections'] += pool.num_connections
+            stats['requests'] += pool.num_requests
+            stats['idle'] += sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+
+        if not self._keep_alive:
+            stats['connections'] = stats['requests']
+
+        stats['reused'] = max(stats['requests'] - stats['connections'], 0)
+        return stats
+
+    def metrics(self):
+        """Returns a snapshot of the request and parsing metrics recorded by the JSS (see metrics.Metrics)"""
+        return self._metrics.snapshot()
+
+    def cache_stats(self):
+        """Returns the stats() of the response cache or None if there is no cache"""
+        return self.cache.stats() if self.cache is not None else None
+
+    def _metrics_path(self, url):
+        """Returns the resource path of a url (e.g. 'computers') that metrics are recorded under"""
+        return url[len(self._url) + 1:].split('/', 1)[0]
+
+    def _cache_resource(self, url):
+        """Returns the url of the collection a url belongs to - the responses of a resource are cached under it"""
+        return '{}/{}'.format(self._url, self._metrics_path(url))
+
+    def _compress(self, data, headers):
+        """
+        Returns the gzipped body and headers of a request if the body is at least 'compress_min_size' bytes
+            an UploadBody is compressed block by block into a new UploadBody (closed by _request())
+        """
+        if data is None or len(data) < self._compress_min_size:
+            return data, headers
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        headers = dict(headers or {})
+        headers['Content-Encoding'] = 'gzip'
+        if isinstance(data, UploadBody):
+            spool = tempfile.SpooledTemporaryFile(self._spool_size)
+            for block in data:
+                spool.write(compressor.compress(block))
+
+            spool.write(compressor.flush())
+            spool.seek(0)
+            return UploadBody([spool]), headers
+
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        return compressor.compress(data) + compressor.flush(), headers
+
+    def _body(self, xml):
+        """
+        Returns the body of a POST or PUT request: an element is serialized into a spooled UploadBody
+            raises a TypeError for anything other than an element, a string or bytes
+        """
+        if isinstance(xml, (bytes, type(u''))):
+            return xml
+        elif not xmlbackend.iselement(xml):
+            raise TypeError("the data of a request must be XML as a string, bytes or an element: {!r}".format(xml))
+
+        spool = tempfile.SpooledTemporaryFile(self._spool_size)
+        xmlbackend.write(xml, spool)
+        spool.seek(0)
+        return UploadBody([spool])
+
+    def _send(self, method, url, **kwargs):
+        """Sends one request and records its metrics - an UploadBody is rewound first so a retry sends all of it"""
+        data = kwargs.get('data')
+        if isinstance(data, UploadBody):
+            data.rewind()
+
+        request_bytes = len(data) if isinstance(data, (bytes, type(u''), UploadBody)) else 0
+        start = time.time()
+        try:
+            resp = self._session.request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            self._metrics.request(self._metrics_path(url), method, e.__class__.__name__, time.time() - start,
+                                  request_bytes)
+            raise
+
+        if kwargs.get('stream'):
+            response_bytes = int(resp.headers.get('Content-Length') or 0)
+        else:
+            response_bytes = len(resp.content)
+
+        self._metrics.request(self._metrics_path(url), method, resp.status_code, time.time() - start, request_bytes,
+                              response_bytes)
+        return resp
+
+    def _request(self, method, url, before_retry=None, compress=True, retry=True, **kwargs):
+        """
+        Sends a request and retries it according to the RetryPolicy
+            raises an HTTPError once the policy gives up on a failing response
+            'before_retry' is called before every retry: if it returns a value other than None that value is
+            returned in place of the response and no further attempts are made
+            pass 'compress' False to send the body as it is with 'compress_requests' (e.g. a file upload)
+            pass 'retry' False to send the request once whatever the policy (e.g. a write that can not be checked)
+        """
+        kwargs.setdefault('timeout', self._timeout)
+        data = kwargs.get('data')
+        if self._compress_requests and compress and method in ('POST', 'PUT'):
+            kwargs['data'], kwargs['headers'] = self._compress(data, kwargs.get('headers'))
+
+        try:
+            return self._send_with_retries(method, url, before_retry, retry, **kwargs)
+        finally:
+            if isinstance(kwargs.get('data'), UploadBody) and kwargs['data'] is not data:
+                kwargs['data'].close()
+
+            if self.cache is not None and method != 'GET':
+                # A failed write may still have changed the resource
+                self.cache.invalidate(self._cache_resource(url))
+
+    def _send_with_retries(self, method, url, before_retry=None, retry=True, **kwargs):
+        """Sends a request until it succeeds or the RetryPolicy gives up (see _request())"""
+        should_retry = self._retry.should_retry if retry else lambda *args: False
+        attempt = 0
+        while True:
+            try:
+                resp = self._send(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if not should_retry(method, attempt):
+                    raise
+
+                reason = e.__class__.__name__
+                delay = self._retry.backoff(attempt)
+            else:
+                if resp.status_code < 400 or not should_retry(method, attempt, resp.status_code):
+                    resp.raise_for_status()
+                    return resp
+
+                reason = resp.status_code
+                delay = self._retry.backoff(attempt, resp.status_code, resp.headers)
+                resp.close()
+
+            attempt += 1
+            logging.warning("{} {} failed ({}): retry {} of {} in {:.1f}s".format(
+                method, url, reason, attempt, self._retry.retries[method], delay))
+            time.sleep(delay)
+            if before_retry is not None:
+                result = before_retry()
+                if result is not None:
+                    return result
+
+    def _probe(self, url):
+        """
+        Sends a single GET for an object to check the outcome of a failed write (not retried, see _existing_id() and
+            _deleted_id())
+            returns the response, the status code of a failed response or None if the request itself failed
+        """
+        try:
+            resp = self._send('GET', url, headers={"Accept": "application/xml"}, timeout=self._timeout)
+        except requests.exceptions.RequestException:
+            return None
+
+        if resp.status_code >= 400:
+            resp.close()
+            return resp.status_code
+
+        return resp
+
+    def _existing_id(self, url, data):
+        """Returns the id of an object on the JSS with the same name as the XML passed or None if there is none or
+            the JSS could not be checked"""
+        name = self._object_name(data)
+        if not name:
+            return None
+
+        resp = self._probe('{}/name/{}'.format(url, quote(name.encode('utf-8'), safe='')))
+        if not isinstance(resp, requests.Response):
+            return None
+
+        obj_id = self._parse_id(resp.text)
+        logging.info(u"the object '{}' was created by a previous attempt: id {}".format(name, obj_id))
+        return obj_id
+
+    def _deleted_id(self, url):
+        """Returns the id or name at the end of a url if the object no longer exists on the JSS, otherwise None (also
+            when the JSS could not be checked)"""
+        if self._probe(url) != 404:
+            return None
+
+        logging.info("the object '{}' was deleted by a previous attempt".format(url))
+        return url.rsplit('/', 1)[1]
+
+    def _get_version(self):
+        """Returns the version of the JSS (uses deprecated API)"""
+        resp = self._request('GET', '{}/jssuser'.format(self._url))
+        return self._parse_version(resp.text)
+
+    def _stream_list(self, resp, list_value, group_filter):
+        """Yields the ids of a collection from a streamed response and closes the response when finished"""
+        resp.raw.decode_content = True
+        try:
+            for i in self._iter_list(resp.raw, list_value, group_filter):
+                yield i
+        finally:
+            resp.close()
+
+    def _parse_response(self, url, xml, list_value, group_filter):
+        """Returns _parse_get() for the response to a GET and records the time spent parsing collections"""
+        if not list_value:
+            return self._parse_get(xml, list_value, group_filter)
+
+        start = time.time()
+        result = self._parse_get(xml, list_value, group_filter)
+        self._metrics.parse(self._metrics_path(url), 'return_list', time.time() - start)
+        return result
+
     def _get(self, url, list_value=None, group_filter=None):
         """REST API GET request
-            returns a list of ids (as integers) for a collection
-            returns a string (xml text) for single objects"""
+            returns a list of ids (as integers) for a collection - or a generator of ids if 'stream_lists' is True
+            returns a string (xml text) for single objects - or bytes if 'return_bytes' is True"""
         logging.debug('GET: {}'.format(url))
-        resp = self._session.get(url, headers=self._accept_header)
-        resp.raise_for_status()
-        if list_value and group_filter is None:
-            logging.debug("returning id list for collection")
-            return self._return_list(resp.text, list_value)
-        elif list_value and group_filter:
-            logging.debug("returning filtered list of ids for group collection")
-            return self._return_group_list_filtered(resp.text, list_value, group_filter)
-        else:
-            return resp.text
+        if self.snapshot is not None:
+            key = url[len(self._url) + 1:]
+            xml = self.snapshot.get(key)
+            if xml is None:
+                xml = self._request('GET', url, headers=self._accept_header).text
+                self.snapshot.put(key, xml)
+
+            return self._parse_response(url, xml, list_value, group_filter)
+
+        if list_value and self._stream_lists:
+            logging.debug("streaming id list for collection")
+            resp = self._request('GET', url, headers={"Accept": "application/xml"}, stream=True)
+            return self._stream_list(resp, list_value, group_filter)
+
+        as_bytes = bool(list_value) or self._return_bytes
+        if self.cache is not None:
+            resource = self._cache_resource(url)
+            accept = self._accept_header['Accept']
+            body = self.cache.get(resource, url, accept)
+            if body is None:
+                generation = self.cache.generation(resource)
+                body = self._request('GET', url, headers=self._accept_header).content
+                self.cache.put(resource, url, accept, body, generation)
+
+            if not as_bytes:
+                body = body.decode('utf-8')
+
+            return self._parse_response(url, body, list_value, group_filter)
+
+        resp = self._request('GET', url, headers=self._accept_header)
+        return self._parse_response(url, resp.content if as_bytes else resp.text, list_value, group_filter)
 
     def _post(self, url, xml):
         """REST API POST request
             returns the id of the created resource
-            returns None if 'read_only' is True"""
-        data = self._element_check(xml)
+            returns None if 'read_only' is True
+            before a failed POST is retried the JSS is checked for an object of the same name - if one is found the
+            first attempt is assumed to have created it and its id is returned"""
         logging.debug('POST: {}'.format(url))
-        logging.debug('DATA: {}'.format(data))
+        self._log_data(xml)
         if self._read_only:
             logging.info("api read_only is enabled")
             return None
 
-        url += '/id/0'
-        resp = self._session.post(url, data, headers=self._content_header)
-        resp.raise_for_status()
-        return etree.fromstring(resp.text).findtext('id')
+        data = self._body(xml)
+        try:
+            resp = self._request('POST', url + '/id/0', data=data, headers=self._content_header,
+                                 before_retry=lambda: self._existing_id(url, xml))
+        finally:
+            if isinstance(data, UploadBody):
+                data.close()
+
+        if not isinstance(resp, requests.Response):
+            return resp
+
+        return self._parse_id(resp.text)
 
     def _put(self, url, xml):
         """REST API PUT request
             returns the id of the updated resource
             returns None if 'read_only' is True"""
-        data = self._element_check(xml)
         logging.debug('PUT: {}'.format(url))
-        logging.debug('DATA: {}'.format(data))
+        self._log_data(xml)
         if self._read_only:
             logging.info("api read_only is enabled")
             return None
 
-        resp = self._session.put(url, data, headers=self._content_header)
-        resp.raise_for_status()
-        return etree.fromstring(resp.text).findtext('id')
+        data = self._body(xml)
+        try:
+            resp = self._request('PUT', url, data=data, headers=self._content_header)
+        finally:
+            if isinstance(data, UploadBody):
+                data.close()
+
+        return self._parse_id(resp.text)
 
     def _delete(self, url):
         """REST API DELETE request
             returns the id of the deleted resource
-            returns None if 'read_only' is True"""
+            returns None if 'read_only' is True
+            before a failed DELETE is retried the JSS is checked for the object - if it is gone the first attempt is
+            assumed to have deleted it"""
         logging.debug('DELETE: {}'.format(url))
         if self._read_only:
             logging.info("api read_only is enabled")
             return None
 
-        resp = self._session.delete(url)
-        resp.raise_for_status()
-        return etree.fromstring(resp.text).findtext('id')
-
-    def _standard_object(self, **kwargs):
-        """Method for interacting with most objects"""
-        id_name = kwargs.pop('id_name')
-        data = kwargs.pop('data')
-        delete = kwargs.pop('delete')
-        path = kwargs.pop('path')
-        list_value = kwargs.pop('list_value')
-        obj_url = '{}/{}'.format(self._url, path)
-        if not (id_name or data or delete):
-            return self._get(obj_url, list_value)
-        elif data and not (id_name or delete):
-            return self._post(obj_url, data)
-        else:
-            obj_url = self._append_id_name(obj_url, id_name)
-            if id_name and not (data or delete):
-                return self._get(obj_url)
-            elif id_name and data and not delete:
-                return self._put(obj_url, data)
-            elif id_name and delete and not data:
-                return self._delete(obj_url)
-            else:
-                raise Exception
-
-    def _group_object(self, **kwargs):
-        """Method for interacting with group objects"""
-        id_name = kwargs.pop('id_name')
-        data = kwargs.pop('data')
-        delete = kwargs.pop('delete')
-        path = kwargs.pop('path')
-        list_value = kwargs.pop('list_value')
-        obj_url = '{}/{}'.format(self._url, path)
-        if not (id_name or data or delete):
-            group_filter = kwargs.pop('group_filter')
-            if group_filter not in ('smart', 'static', None):
-                logging.debug("invalid filter: must be 'smart', 'static' or None")
-                raise Exception
-
-            return self._get(obj_url, list_value, group_filter)
-        elif data and not (id_name or delete):
-            return self._post(obj_url, data)
-        else:
-            obj_url = self._append_id_name(obj_url, id_name)
-            if id_name and not (data or delete):
-                return self._get(obj_url)
-            elif id_name and data and not delete:
-                return self._put(obj_url, data)
-            elif id_name and delete and not data:
-                return self._delete(obj_url)
-            else:
-                raise Exception
-
-    def buildings(self, id_name=None, data=None, delete=False):
-        """/JSSResource/buildings"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='buildings', list_value='building')
-
-    def categories(self, id_name=None, data=None, delete=False):
-        """/JSSResource/categories"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='categories',
-                                     list_value='category')
+        resp = self._request('DELETE', url, before_retry=lambda: self._deleted_id(url))
+        if not isinstance(resp, requests.Response):
+            return resp
 
-    def computers(self, id_name=None, data=None, delete=False):
-        """/JSSResource/computers"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='computers', list_value='computer')
+        return self._parse_id(resp.text)
 
-    def computer_extension_attributes(self, id_name=None, data=None, delete=False):
-        """/JSSResource/computerextensionattributes"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='computerextensionattributes',
-                                     list_value='computer_extension_attribute')
-
-    def computer_groups(self, id_name=None, data=None, delete=False, group_filter=None):
-        """
-        /JSSResource/computergroups
-            group_filter: 'smart', 'static' or None
-        """
-        return self._group_object(id_name=id_name, data=data, delete=delete, path='computergroups',
-                                  list_value='computer_group', group_filter=group_filter)
-
-    def departments(self, id_name=None, data=None, delete=False):
-        """/JSSResource/departments"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='departments',
-                                     list_value='department')
-
-    def ebooks(self, id_name=None, data=None, delete=False):
-        """/JSSResource/ebooks"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='ebooks', list_value='ebook')
-
-    def ibeacons(self, id_name=None, data=None, delete=False):
-        """/JSSResource/ibeacons"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='ibeacons', list_value='ibeacon')
-
-    def ldap_servers(self, id_name=None, data=None, delete=False):
-        """/JSSResource/ldapservers"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='ldapservers',
-                                     list_value='ldap_server')
-
-    def mac_applications(self, id_name=None, data=None, delete=False):
-        """/JSSResource/macapplications"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='macapplications',
-                                     list_value='mac_application')
-
-    def mobile_device_applications(self, id_name=None, data=None, delete=False):
-        """/JSSResource/mobiledeviceapplications"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='mobiledeviceapplications',
-                                     list_value='mobile_device_application')
-
-    def mobile_device_configuration_profiles(self, id_name=None, data=None, delete=False):
-        """/JSSResource/mobiledeviceconfigurationprofiles"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete,
-                                     path='mobiledeviceconfigurationprofiles', list_value='configuration_profile')
-
-    def mobile_device_extension_attributes(self, id_name=None, data=None, delete=False):
-        """/JSSResource/mobiledeviceextensionattributes"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='mobiledeviceextensionattributes',
-                                     list_value='mobile_device_extension_attribute')
-
-    def mobile_device_groups(self, id_name=None, data=None, delete=False, group_filter=None):
-        """
-        /JSSResource/mobiledevicegroups
-            group_filter: 'smart', 'static' or None
-        """
-        return self._group_object(id_name=id_name, data=data, delete=delete, path='mobiledevicegroups',
-                                  list_value='mobile_device_group', group_filter=group_filter)
-
-    def mobile_devices(self, id_name=None, data=None, delete=False):
-        """/JSSResource/mobiledevices"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='mobiledevices',
-                                     list_value='mobile_device')
-
-    def network_segments(self, id_name=None, data=None, delete=False):
-        """/JSSResource/networksegments"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='networksegments',
-                                     list_value='network_segment')
-
-    def os_x_configuration_profiles(self, id_name=None, data=None, delete=False):
-        """/JSSResource/osxconfigurationprofiles"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='osxconfigurationprofiles',
-                                     list_value='os_x_configuration_profile')
-
-    def packages(self, id_name=None, data=None, delete=False):
-        """/JSSResource/packages"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='packages', list_value='package')
-
-    def peripherals(self, id_name=None, data=None, delete=False):
-        """/JSSResource/buildings"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='peripherals',
-                                     list_value='peripheral')
-
-    def peripheral_types(self, id_name=None, data=None, delete=False):
-        """/JSSResource/peripheraltypes"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='peripheraltypes',
-                                     list_value='peripheral_type')
-
-    def policies(self, id_name=None, data=None, delete=False):
-        """/JSSResource/policies"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='policies', list_value='policy')
-
-    def printers(self, id_name=None, data=None, delete=False):
-        """/JSSResource/printers"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='printers', list_value='printer')
-
-    def scripts(self, id_name=None, data=None, delete=False):
-        """/JSSResource/scripts"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='scripts', list_value='script')
-
-    def user_extension_attributes(self, id_name=None, data=None, delete=False):
-        """/JSSResource/userextensionattributes"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='userextensionattributes',
-                                     list_value='user_extension_attribute')
-
-    def user_groups(self, id_name=None, data=None, delete=False, group_filter=None):
+    def upload_file(self, kind, id_name, fileobj, filename=None, content_type='application/octet-stream'):
         """
-        /JSSResource/usergroups
-            group_filter: 'smart', 'static' or None
+        Uploads a file to an object through /fileuploads (e.g. an attachment of a computer or the icon of a policy)
+            'kind' is a key of file_uploads and 'id_name' the id or name of the object
+            'fileobj' is a file opened in binary mode: it is sent from its current position in blocks as a
+            multipart/form-data body so the size of the file does not add to memory use (it is not closed)
+            'filename' defaults to the name of the file
+            The upload is not retried: a POST that failed or timed out may still have attached the file, and the JSS
+            has no way to check, so a second attempt could attach it twice - retry it yourself once you have checked
+            returns True once the file has been uploaded or None if 'read_only' is True
         """
-        return self._group_object(id_name=id_name, data=data, delete=delete, path='usergroups',
-                                  list_value='user_group', group_filter=group_filter)
+        url = self._append_id_name('{}/fileuploads/{}'.format(self._url, file_uploads[kind]), id_name)
+        logging.debug('POST: {}'.format(url))
+        if self._read_only:
+            logging.info("api read_only is enabled")
+            return None
+
+        if filename is None:
+            filename = os.path.basename(getattr(fileobj, 'name', None) or 'file')
 
-    def users(self, id_name=None, data=None, delete=False):
-        """/JSSResource/users"""
-        return self._standard_object(id_name=id_name, data=data, delete=delete, path='users', list_value='user')
+        boundary = uuid.uuid4().hex
+        head = u'--{}\r\nContent-Disposition: form-data; name="name"; filename="{}"\r\nContent-Type: {}\r\n\r\n'.format(
+            boundary, filename.replace('"', '\\"'), content_type)
+        data = UploadBody([head, fileobj, u'\r\n--{}--\r\n'.format(boundary)])
+        self._request('POST', url, compress=False, retry=False, data=data,
+                      headers={'Content-Type': 'multipart/form-data; boundary=' + boundary})
+        if self.cache is not None and kind in collections:
+            self.cache.invalidate('{}/{}'.format(self._url, collections[kind][0]))
 
+        return True
@@ -1,4 +1,5 @@
 from config import config
+import journal
 import jsslib
 import logging
 import promoter
@@ -20,12 +21,30 @@ def main():
     trg_cfg = config['target_jss']
     logging.info("Target JSS: {}".format(trg_cfg['url']))
 
-    source_jss = jsslib.JSS(src_cfg['url'], src_cfg['username'], src_cfg['password'], read_only=True)
-    target_jss = jsslib.JSS(trg_cfg['url'], trg_cfg['username'], trg_cfg['password'])
-
-    logging.info("prepping target jss")
-    promoter.clean_jss(target_jss)
-    promoter.promote_jss(source_jss, target_jss)
+    source_jss = jsslib.JSS(src_cfg['url'], src_cfg['username'], src_cfg['password'], read_only=True,
+                            version_cache=config['version_cache'], return_bytes=True)
+    target_jss = jsslib.JSS(trg_cfg['url'], trg_cfg['username'], trg_cfg['password'],
+                            version_cache=config['version_cache'])
+
+    promoter_cfg = config['promoter']
+    journal_path = promoter_cfg['journal_path']
+    if journal_path and not promoter_cfg['resume']:
+        # The journal of an earlier run is only read when resuming it - otherwise every object it lists is skipped
+        logging.info("starting a new journal: {}".format(journal_path))
+        journal.remove(journal_path)
+
+    if not promoter_cfg['upsert']:
+        logging.info("prepping target jss")
+        promoter.clean_jss(target_jss, workers=promoter_cfg['workers'], resume=journal_path)
+
+    stats = promoter.promote_jss(source_jss, target_jss, workers=promoter_cfg['workers'],
+                                 upsert=promoter_cfg['upsert'], index_path=promoter_cfg['index_path'],
+                                 resume=journal_path, metrics_path=promoter_cfg['metrics_path'],
+                                 processes=promoter_cfg['processes'])
+
+    if journal_path and all(target['error'] is None for target in stats['targets']):
+        logging.info("promotion complete: removing journal {}".format(journal_path))
+        journal.remove(journal_path)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -5,6 +5,10 @@ document.
 Here is the default layout for a manifest:
 {
     objectName: {
+        'dependencies': {
+            Element/Path1: resource,
+            Element/Path2: resource
+        },
         'exclude': [
             Element/Path1,
             Element/Path2
@@ -25,20 +29,35 @@ Here is the default layout for a manifest:
 }
 
 Elements in the 'exclude' list will be omitted.
+    With fetch_subsets set to True, for resources that support subsets (see jsslib.subsets) excluding a whole
+    section (e.g. 'peripherals') means promoter does not request that section from the JSS at all. Only the sections
+    jsslib.subsets lists are then requested - leave it False unless that table lists every section the objects have
+    on the JSS version in use, otherwise sections it does not know (e.g. ones added by later versions) are dropped
 Elements in the 'override' dictionary must not be in the 'exclude' list or they will be skipped.
 New elements can be injected into the output XML by passing the path and value in the 'inject' dictionary
     (e.g. can be used to pass a password with the XML when POSTing to a resource)
 Objects that contain collections referencing other objects can be listed in the 'collections' list
     These collections will have all 'id' elements removed
+Elements that link to other JSS objects are mapped to the resource of those objects in the 'dependencies' dictionary
+    (e.g. 'general/category': 'categories'). promoter.promote_objects() reads the names of the linked objects from
+    these elements once the rest of the manifest has been applied and promotes the objects that are missing from the
+    target JSS first. The element may hold the name as its text ('location/building'), have a 'name' child
+    ('general/category') or be a collection of elements that each have a 'name' child ('scope/computer_groups')
 
 If there is no manifest in this dictionary the object would be copies as-is.
 
-The three global_ variables are applied to all objects.
+The four global_ variables are applied to all objects.
     For example: including 'id' and 'site' in the global_exclusions list will remove those elements from
     all ElementTree.Element objects that are processed
+
+The resource_dependencies dictionary declares, for every resource, the resources its objects link to.
+    promoter promotes a resource once all of the resources it depends on have been promoted and cleans a resource
+    once all of the resources that depend on it have been cleaned - unrelated resources are processed in parallel
 """
 __author__ = 'brysontyrrell'
 
+fetch_subsets = False
+
 global_exclusions = [
     'general/id',
     'general/site',
@@ -57,14 +76,86 @@ global_injections = {}
 
 global_collections = {}
 
+global_dependencies = {
+    'category': 'categories',
+    'general/category': 'categories',
+    'location/building': 'buildings',
+    'location/department': 'departments',
+    'location/username': 'users',
+    'self_service/self_service_categories': 'categories',
+    'scope/computers': 'computers',
+    'scope/computer_groups': 'computer_groups',
+    'scope/buildings': 'buildings',
+    'scope/departments': 'departments',
+    'scope/mobile_devices': 'mobile_devices',
+    'scope/mobile_device_groups': 'mobile_device_groups',
+    'scope/limitations/user_groups': 'user_groups',
+    'scope/limitations/network_segments': 'network_segments',
+    'scope/limitations/ibeacons': 'ibeacons',
+    'scope/exclusions/computers': 'computers',
+    'scope/exclusions/computer_groups': 'computer_groups',
+    'scope/exclusions/buildings': 'buildings',
+    'scope/exclusions/departments': 'departments',
+    'scope/exclusions/mobile_devices': 'mobile_devices',
+    'scope/exclusions/mobile_device_groups': 'mobile_device_groups',
+    'scope/exclusions/user_groups': 'user_groups',
+    'scope/exclusions/network_segments': 'network_segments',
+    'scope/exclusions/ibeacons': 'ibeacons'
+}
+
+_scope_dependencies = [
+    'buildings',
+    'categories',
+    'departments',
+    'ibeacons',
+    'network_segments',
+    'user_groups'
+]
+
+resource_dependencies = {
+    # Stand-alone objects
+    'buildings': [],
+    'categories': [],
+    'computer_extension_attributes': [],
+    'departments': [],
+    'ibeacons': [],
+    'ldap_servers': [],
+    'mobile_device_extension_attributes': [],
+    'peripheral_types': [],
+    'user_extension_attributes': [],
+    # Objects that point to other objects
+    'network_segments': ['buildings', 'departments'],
+    'packages': ['categories'],
+    'printers': ['categories'],
+    'scripts': ['categories'],
+    # Device and user records
+    'users': ['ldap_servers', 'user_extension_attributes'],
+    'computers': ['buildings', 'computer_extension_attributes', 'departments', 'users'],
+    'mobile_devices': ['buildings', 'departments', 'mobile_device_extension_attributes', 'users'],
+    'peripherals': ['buildings', 'departments', 'peripheral_types'],
+    # Groups
+    'computer_groups': ['computers'],
+    'mobile_device_groups': ['mobile_devices'],
+    'user_groups': ['users'],
+    # Objects that have scope
+    'ebooks': _scope_dependencies + ['computers', 'computer_groups', 'mobile_devices', 'mobile_device_groups'],
+    'mac_applications': _scope_dependencies + ['computers', 'computer_groups'],
+    'mobile_device_applications': _scope_dependencies + ['mobile_devices', 'mobile_device_groups'],
+    'mobile_device_configuration_profiles': _scope_dependencies + ['mobile_devices', 'mobile_device_groups'],
+    'os_x_configuration_profiles': _scope_dependencies + ['computers', 'computer_groups'],
+    'policies': _scope_dependencies + ['computers', 'computer_groups', 'packages', 'printers', 'scripts']
+}
+
 manifests = {
     'computer_groups': {
+        'dependencies': {},
         'exclude': ['computers'],
         'override': {},
         'inject': {},
         'collections': []
     },
     'computers': {
+        'dependencies': {'extension_attributes': 'computer_extension_attributes'},
         'exclude': [
             'general/remote_management/management_password_md5',
             'general/remote_management/management_password_sha256',
@@ -84,6 +175,7 @@ manifests = {
         ]
     },
     'ebooks': {
+        'dependencies': {},
         'exclude': [
             'general/self_service_icon',
             'self_service/self_service_icon',
@@ -116,6 +208,7 @@ manifests = {
         ]
     },
     'ldap_servers': {
+        'dependencies': {},
         'exclude': [
             'account/password_md5',
             'account/password_sha256'
@@ -128,6 +221,7 @@ manifests = {
         'collections': []
     },
     'mac_applications': {
+        'dependencies': {},
         'exclude': [
             'self_service/self_service_categories',
             'self_service/self_service_icon',
@@ -153,6 +247,7 @@ manifests = {
         ]
     },
     'mobile_device_applications': {
+        'dependencies': {},
         'exclude': [
             'general/ipa',
             'general/icon',
@@ -180,6 +275,7 @@ manifests = {
         ]
     },
     'mobile_device_configuration_profiles': {
+        'dependencies': {},
         'exclude': ['self_service/self_service_icon'],
         'override': {},
         'inject': {},
@@ -202,12 +298,14 @@ manifests = {
         ]
     },
     'mobile_device_groups': {
+        'dependencies': {},
         'exclude': ['mobile_devices'],
         'override': {},
         'inject': {},
         'collections': []
     },
     'mobile_devices': {
+        'dependencies': {'extension_attributes': 'mobile_device_extension_attributes'},
         'exclude': [
             'general/computer',
             'general/phone_number'
@@ -221,12 +319,17 @@ manifests = {
         'collections': ['extension_attributes']
     },
     'network_segments': {
+        'dependencies': {
+            'building': 'buildings',
+            'department': 'departments'
+        },
         'exclude': [],
         'override': {'distribution_server': 'jds.starfleet.corp'},
         'inject': {},
         'collections': []
     },
     'os_x_configuration_profiles': {
+        'dependencies': {},
         'exclude': ['self_service/self_service_icon'],
         'override': {},
         'inject': {},
@@ -249,6 +352,7 @@ manifests = {
         ]
     },
     'peripherals': {
+        'dependencies': {'general/type': 'peripheral_types'},
         'exclude': [
             'general/computer_id',
             'location/phone',
@@ -259,6 +363,11 @@ manifests = {
         'collections': []
     },
     'policies': {
+        'dependencies': {
+            'package_configuration/packages': 'packages',
+            'printers': 'printers',
+            'scripts': 'scripts'
+        },
         'exclude': [
             'general/override_default_settings',
             'self_service/self_service_icon',
@@ -287,12 +396,17 @@ manifests = {
         ]
     },
     'user_groups': {
+        'dependencies': {},
         'exclude': ['users'],
         'override': {},
         'inject': {},
         'collections': []
     },
     'users': {
+        'dependencies': {
+            'extension_attributes': 'user_extension_attributes',
+            'ldap_server': 'ldap_servers'
+        },
         'exclude': [
             'sites',
             'links',
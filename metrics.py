@@ -0,0 +1,178 @@
+"""Request and parsing metrics for JSS objects"""
+import json
+import os
+import threading
+
+__author__ = 'brysontyrrell'
+
+# The upper bounds (in seconds) of the request latency histogram buckets
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf'))
+
+
+class Metrics(object):
+    """
+    Counts, status codes, latency histograms and bytes sent and received for every request to a JSS by resource path
+        and HTTP method, and the time spent parsing XML by resource path and stage ('return_list', 'process_xml')
+
+    Every thread records into its own set of counters so recording never waits on a lock - snapshot() adds up the
+        counters of all threads. One Metrics object can be shared by several JSS objects
+    """
+    def __init__(self):
+        """Initialize the Metrics class"""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = list()
+
+    def _shard(self):
+        """Returns the counters of the current thread"""
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = (dict(), dict())
+            with self._lock:
+                self._shards.append(shard)
+
+        return shard
+
+    def request(self, path, method, status, seconds, request_bytes=0, response_bytes=0):
+        """Records a request: 'status' is the status code of the response or the name of the exception raised"""
+        requests = self._shard()[0]
+        counters = requests.get((path, method))
+        if counters is None:
+            counters = requests[(path, method)] = [0, dict(), [0] * len(latency_buckets), 0.0, 0, 0]
+
+        counters[0] += 1
+        counters[1][status] = counters[1].get(status, 0) + 1
+        for i, bound in enumerate(latency_buckets):
+            if seconds <= bound:
+                counters[2][i] += 1
+                break
+
+        counters[3] += seconds
+        counters[4] += request_bytes
+        counters[5] += response_bytes
+
+    def parse(self, path, stage, seconds):
+        """Records the time spent parsing XML"""
+        parsing = self._shard()[1]
+        counters = parsing.get((path, stage))
+        if counters is None:
+            counters = parsing[(path, stage)] = [0, 0.0]
+
+        counters[0] += 1
+        counters[1] += seconds
+
+    def snapshot(self):
+        """
+        Returns a dictionary of the metrics recorded so far:
+            {'requests': {path: {method: {'count', 'status', 'latency', 'request_bytes', 'response_bytes'}}},
+             'parsing': {path: {stage: {'count', 'seconds'}}}}
+            'latency' is {'buckets': [[upper bound, cumulative count], ...], 'sum': seconds}
+        """
+        with self._lock:
+            shards = list(self._shards)
+
+        requests = dict()
+        parsing = dict()
+        for shard_requests, shard_parsing in shards:
+            for (path, method), counters in list(shard_requests.items()):
+                totals = requests.setdefault(path, dict()).setdefault(method, [0, dict(), [0] * len(latency_buckets),
+                                                                               0.0, 0, 0])
+                totals[0] += counters[0]
+                for status, count in list(counters[1].items()):
+                    totals[1][str(status)] = totals[1].get(str(status), 0) + count
+
+                totals[2] = [a + b for a, b in zip(totals[2], counters[2])]
+                totals[3] += counters[3]
+                totals[4] += counters[4]
+                totals[5] += counters[5]
+
+            for (path, stage), counters in list(shard_parsing.items()):
+                totals = parsing.setdefault(path, dict()).setdefault(stage, [0, 0.0])
+                totals[0] += counters[0]
+                totals[1] += counters[1]
+
+        for path, methods in requests.items():
+            for method, totals in methods.items():
+                cumulative = 0
+                buckets = list()
+                for bound, count in zip(latency_buckets, totals[2]):
+                    cumulative += count
+                    buckets.append(['+Inf' if bound == float('inf') else bound, cumulative])
+
+                methods[method] = {
+                    'count': totals[0],
+                    'status': totals[1],
+                    'latency': {'buckets': buckets, 'sum': totals[3]},
+                    'request_bytes': totals[4],
+                    'response_bytes': totals[5]
+                }
+
+        for path, stages in parsing.items():
+            for stage, totals in stages.items():
+                stages[stage] = {'count': totals[0], 'seconds': totals[1]}
+
+        return {'requests': requests, 'parsing': parsing}
+
+
+def _prometheus_lines(jss, snapshot):
+    """Returns the lines of the Prometheus text format for a snapshot labelled with the name of the JSS"""
+    lines = list()
+    for path, methods in sorted(snapshot['requests'].items()):
+        for method, values in sorted(methods.items()):
+            labels = 'jss="{}",path="{}",method="{}"'.format(jss, path, method)
+            for status, count in sorted(values['status'].items()):
+                lines.append(('jss_requests_total', '{{{},status="{}"}} {}'.format(labels, status, count)))
+
+            for bound, count in values['latency']['buckets']:
+                lines.append(('jss_request_duration_seconds', '_bucket{{{},le="{}"}} {}'.format(labels, bound, count)))
+
+            lines.append(('jss_request_duration_seconds', '_sum{{{}}} {}'.format(labels, values['latency']['sum'])))
+            lines.append(('jss_request_duration_seconds', '_count{{{}}} {}'.format(labels, values['count'])))
+            lines.append(('jss_request_bytes_total', '{{{}}} {}'.format(labels, values['request_bytes'])))
+            lines.append(('jss_response_bytes_total', '{{{}}} {}'.format(labels, values['response_bytes'])))
+
+    for path, stages in sorted(snapshot['parsing'].items()):
+        for stage, values in sorted(stages.items()):
+            labels = 'jss="{}",path="{}",stage="{}"'.format(jss, path, stage)
+            lines.append(('jss_parse_total', '{{{}}} {}'.format(labels, values['count'])))
+            lines.append(('jss_parse_seconds_total', '{{{}}} {}'.format(labels, values['seconds'])))
+
+    return lines
+
+
+_prometheus_types = [
+    ('jss_requests_total', 'counter', 'Requests sent to the JSS API by status code'),
+    ('jss_request_duration_seconds', 'histogram', 'Latency of requests to the JSS API'),
+    ('jss_request_bytes_total', 'counter', 'Bytes of request bodies sent to the JSS API'),
+    ('jss_response_bytes_total', 'counter', 'Bytes of response bodies received from the JSS API'),
+    ('jss_parse_total', 'counter', 'XML documents parsed'),
+    ('jss_parse_seconds_total', 'counter', 'Time spent parsing XML')
+]
+
+
+def write_metrics(path, snapshots):
+    """
+    Writes metrics snapshots to a file: a Prometheus textfile if 'path' ends with '.prom', JSON otherwise
+        'snapshots' is a dictionary of names (e.g. 'source', 'target') to the snapshots of Metrics objects
+        The file is replaced in one step so a collector never reads a partly written file
+    """
+    if path.endswith('.prom'):
+        lines = list()
+        for jss, snapshot in sorted(snapshots.items()):
+            lines.extend(_prometheus_lines(jss, snapshot))
+
+        text = list()
+        for name, metric_type, description in _prometheus_types:
+            text.append('# HELP {} {}'.format(name, description))
+            text.append('# TYPE {} {}'.format(name, metric_type))
+            text.extend(name + line for metric, line in lines if metric == name)
+
+        data = '\n'.join(text) + '\n'
+    else:
+        data = json.dumps(snapshots, indent=2, sort_keys=True)
+
+    temp_path = '{}.tmp'.format(path)
+    with open(temp_path, 'w') as f:
+        f.write(data)
+
+    os.rename(temp_path, path)
@@ -0,0 +1,88 @@
+"""An index of object names to ids on a JSS"""
+import json
+import logging
+import os
+import threading
+
+__author__ = 'brysontyrrell'
+
+
+class NameIndex(object):
+    """
+    An in-memory index of object names to ids for the resources on a JSS
+
+    The index for a resource is loaded from its collection list (JSS.names()) the first time it is used and is kept
+        up to date with record() and forget() as objects are written
+
+    Pass 'path' to start from an index saved by a previous run (see save()) instead of loading the collection lists
+        entries in a saved index can be stale - reload() a resource to correct it
+    """
+    def __init__(self, jss, path=None):
+        """Initialize the NameIndex class"""
+        self._jss = jss
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._index = dict()
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def _resource(self, resource):
+        """Returns the index for a resource, loading it from the JSS if needed"""
+        index = self._index.get(resource)
+        if index is None:
+            with self._load_lock:
+                index = self._index.get(resource)
+                if index is None:
+                    index = self.reload(resource)
+
+        return index
+
+    def reload(self, resource):
+        """Replaces the index for a resource with the current collection list from the JSS and returns it"""
+        logging.debug("loading name index for resource: {}".format(resource))
+        index = self._jss.names(resource)
+        with self._lock:
+            self._index[resource] = index
+
+        return index
+
+    def lookup(self, resource, name):
+        """Returns the id of the object with a name or None if it is not in the index"""
+        index = self._resource(resource)
+        with self._lock:
+            return index.get(name)
+
+    def name(self, resource, obj_id):
+        """Returns the name of the object with an id or None if it is not in the index"""
+        index = self._resource(resource)
+        obj_id = int(obj_id)
+        with self._lock:
+            return next((name for name, i in index.items() if i == obj_id), None)
+
+    def record(self, resource, name, obj_id):
+        """Adds or updates the id for an object name"""
+        index = self._resource(resource)
+        with self._lock:
+            index[name] = int(obj_id)
+
+    def forget(self, resource, name):
+        """Removes an object name from the index"""
+        index = self._resource(resource)
+        with self._lock:
+            index.pop(name, None)
+
+    def save(self, path):
+        """Writes the index to a JSON file"""
+        with self._lock:
+            data = json.dumps(self._index)
+
+        with open(path, 'w') as f:
+            f.write(data)
+
+    def load(self, path):
+        """Replaces the index with one saved by save()"""
+        with open(path) as f:
+            data = json.load(f)
+
+        with self._lock:
+            self._index = data
@@ -0,0 +1,226 @@
+"""Stages connected by bounded queues so reading, processing and writing objects overlap with capped memory use"""
+import logging
+import threading
+import time
+
+try:
+    from Queue import Empty, Full, Queue
+except ImportError:
+    from queue import Empty, Full, Queue
+
+__author__ = 'brysontyrrell'
+
+# Passed down a channel once all of its producers have finished
+_end = object()
+
+
+class Stage(object):
+    """
+    A step of a Pipeline: 'func' is called with every item from the previous stage on 'workers' threads
+        the value it returns is passed to the next stage - items it returns None for are dropped
+        With 'fan_out' True 'func' returns a list and each item in it is passed to the next stage separately
+    """
+    def __init__(self, name, func, workers=1, fan_out=False):
+        """Initialize the Stage class"""
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.fan_out = fan_out
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """Records the time taken to process an item"""
+        with self._lock:
+            self.items += 1
+            self.busy += seconds
+
+
+class Channel(object):
+    """
+    A bounded queue between two stages
+        'full' is the time producers spent waiting for space (the consumers are slower) and 'empty' the time
+        consumers spent waiting for an item (the producers are slower) - both summed over all threads
+    """
+    def __init__(self, name, depth, producers, consumers):
+        """Initialize the Channel class"""
+        self.name = name
+        self.depth = depth
+        self.full = 0.0
+        self.empty = 0.0
+        self._queue = Queue(depth)
+        self._producers = producers
+        self._consumers = consumers
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        """Puts an item on the queue, waiting while it is full"""
+        try:
+            self._queue.put_nowait(item)
+            return
+        except Full:
+            pass
+
+        start = time.time()
+        self._queue.put(item)
+        with self._lock:
+            self.full += time.time() - start
+
+    def get(self):
+        """Returns the next item from the queue, waiting while it is empty"""
+        try:
+            return self._queue.get_nowait()
+        except Empty:
+            pass
+
+        start = time.time()
+        item = self._queue.get()
+        with self._lock:
+            self.empty += time.time() - start
+
+        return item
+
+    def close(self):
+        """Called by each producer when it has finished: the last one tells every consumer to stop"""
+        with self._lock:
+            self._producers -= 1
+            last = self._producers == 0
+
+        if last:
+            for _ in range(self._consumers):
+                self._queue.put(_end)
+
+
+class Pipeline(object):
+    """
+    Passes items through a list of Stages, each running on its own threads and connected to the next by a Channel
+        of at most 'depth' items. A stage only takes an item when it has a thread free and blocks when the channel
+        to the next stage is full, so a slow stage holds back the ones before it and no more than 'depth' items
+        wait between any two stages no matter how many items there are
+
+    run() reads the items (any iterable, e.g. a generator) on its own thread and returns once every item has passed
+        through every stage. The first exception raised by a stage stops the pipeline: items still queued are
+        dropped, no more are read and run() raises the exception. stats() reports the time each stage was busy and
+        the time each channel was full or empty
+    """
+    def __init__(self, stages, depth=100):
+        """Initialize the Pipeline class"""
+        self.stages = stages
+        self.depth = depth
+        self.channels = list()
+        self.seconds = 0.0
+        self.error = None
+        self._lock = threading.Lock()
+
+    @property
+    def failed(self):
+        """Tests if a stage has raised an exception"""
+        return self.error is not None
+
+    def _fail(self, error):
+        """Keeps the first exception raised by a stage"""
+        with self._lock:
+            if self.error is None:
+                self.error = error
+
+    def _read(self, items, outbox):
+        """Puts every item on the first channel"""
+        try:
+            for item in items:
+                if self.failed:
+                    break
+
+                outbox.put(item)
+        except Exception as e:
+            logging.exception("reading the items of the pipeline failed")
+            self._fail(e)
+        finally:
+            outbox.close()
+
+    def _work(self, stage, inbox, outbox):
+        """Processes items from a channel until it ends and passes the results to the next channel"""
+        try:
+            while True:
+                item = inbox.get()
+                if item is _end:
+                    return
+
+                if self.failed:
+                    continue
+
+                start = time.time()
+                try:
+                    result = stage.func(item)
+                except Exception as e:
+                    logging.exception("the {} stage of the pipeline failed".format(stage.name))
+                    self._fail(e)
+                    continue
+                finally:
+                    stage.record(time.time() - start)
+
+                if result is None or outbox is None:
+                    continue
+
+                for output in (result if stage.fan_out else [result]):
+                    outbox.put(output)
+        finally:
+            if outbox is not None:
+                outbox.close()
+
+    def run(self, items):
+        """Passes every item through the stages and returns stats()"""
+        names = ['read'] + [stage.name for stage in self.stages]
+        producers = [1] + [stage.workers for stage in self.stages]
+        self.channels = [Channel('{}->{}'.format(names[i], names[i + 1]), self.depth, producers[i], stage.workers)
+                         for i, stage in enumerate(self.stages)]
+        threads = [threading.Thread(target=self._read, args=(items, self.channels[0]), name='pipeline-read')]
+        for i, stage in enumerate(self.stages):
+            outbox = self.channels[i + 1] if i + 1 < len(self.channels) else None
+            for n in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, args=(stage, self.channels[i], outbox),
+                                                name='pipeline-{}-{}'.format(stage.name, n)))
+
+        start = time.time()
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.seconds = time.time() - start
+        if self.error is not None:
+            raise self.error
+
+        return self.stats()
+
+    def stats(self):
+        """
+        Returns a dictionary of the last run:
+            'seconds': the time the run took
+            'stages': [{'name', 'workers', 'items', 'busy'}] in order - 'busy' is the time spent processing summed
+            over threads
+            'channels': [{'name', 'depth', 'full', 'empty'}] in order - see Channel
+        """
+        return {
+            'seconds': self.seconds,
+            'stages': [{'name': stage.name, 'workers': stage.workers, 'items': stage.items, 'busy': stage.busy}
+                       for stage in self.stages],
+            'channels': [{'name': channel.name, 'depth': channel.depth, 'full': channel.full, 'empty': channel.empty}
+                         for channel in self.channels]
+        }
+
+
+def format_stats(stats):
+    """Returns the stats() of a Pipeline as readable text"""
+    lines = ['pipeline finished in {:.1f}s'.format(stats['seconds'])]
+    for stage in stats['stages']:
+        lines.append('    stage {}: {} items on {} threads, busy {:.1f}s'.format(
+            stage['name'], stage['items'], stage['workers'], stage['busy']))
+
+    for channel in stats['channels']:
+        lines.append('    queue {} (depth {}): full {:.1f}s, empty {:.1f}s'.format(
+            channel['name'], channel['depth'], channel['full'], channel['empty']))
+
+    return '\n'.join(lines)
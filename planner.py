@@ -0,0 +1,191 @@
+"""Dry-run estimates of the requests, bytes and time a promotion would take"""
+import logging
+import math
+from jsslib import collections
+from manifests import resource_dependencies
+from multiprocessing.pool import ThreadPool
+from promoter import dependency_order, fetch_object, process_xml, reverse_dependencies
+import time
+from xmlbackend import tostring
+
+__author__ = 'brysontyrrell'
+
+
+def _median(values):
+    """Returns the median of a list of values or None if it is empty"""
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+
+def _list_names(jss):
+    """
+    Lists the collections of every resource in parallel
+        returns a dictionary of resources to (names to ids, bytes of the response, seconds the request took)
+    """
+    def list_resource(resource):
+        if not jss.supports(resource):
+            return resource, (dict(), 0, 0.0)
+
+        path, list_value = collections[resource]
+        start = time.time()
+        xml = jss._get('{}/{}'.format(jss._url, path))
+        elapsed = time.time() - start
+        return resource, (jss._return_name_map(xml, list_value), len(xml), elapsed)
+
+    pool = ThreadPool(len(resource_dependencies))
+    try:
+        return dict(pool.map(list_resource, list(resource_dependencies)))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _sample_objects(jss, resource, ids, sample):
+    """
+    Fetches up to 'sample' objects of a resource
+        returns the average bytes of the objects, the average bytes once processed and the seconds each GET took
+    """
+    sizes = list()
+    processed_sizes = list()
+    latencies = list()
+    for i in ids[:sample]:
+        start = time.time()
+        xml = fetch_object(jss, resource, i)
+        latencies.append(time.time() - start)
+        sizes.append(len(xml.encode('utf-8') if not isinstance(xml, bytes) else xml))
+        processed_sizes.append(len(tostring(process_xml(xml, resource), 'utf-8')))
+
+    if not sizes:
+        return None, None, latencies
+
+    return sum(sizes) // len(sizes), sum(processed_sizes) // len(processed_sizes), latencies
+
+
+def plan(src_jss, trg_jss, mode='promote', sample=0, workers=(1, 2, 4, 8, 16), latency=None):
+    """
+    Estimates the requests, bytes and wall-clock time of a promotion without writing anything
+        The collections of every resource on both JSSs are listed in parallel (one GET each) and with 'sample'
+        greater than 0 that many objects of each source resource are fetched to measure their size. No other
+        requests are made
+
+        'mode' is the promotion to plan:
+            'promote'   clean_jss() of the target then promote_jss()
+            'upsert'    promote_jss(upsert=True) - objects whose names are on the target are PUT, the rest POSTed
+            'sync'      sync_jss() without the state of a previous run - at most every object that is on both
+                        JSSs is fetched from the target and PUT (changes can not be known without comparing the
+                        objects)
+
+        The time of a request is taken to be 'latency' seconds or, if that is None, the median time of the sampled
+        GETs (the collection GETs when nothing was sampled). Wall-clock time is projected for each number of
+        'workers': every resource takes at least as long as its objects need in rounds of 'workers' requests
+        after the resources it depends on, and all requests share the 'workers' threads
+
+    returns a dictionary:
+        'requests': the number of GET, POST, PUT and DELETE requests
+        'bytes': the estimated bytes 'received' and 'sent' (None for objects that were not sampled)
+        'resources': the objects, requests and sizes for each resource
+        'latency': the seconds per request used for projections
+        'duration': a dictionary of each number of workers to the projected seconds
+    """
+    if mode not in ('promote', 'upsert', 'sync'):
+        raise ValueError("mode must be 'promote', 'upsert' or 'sync'")
+
+    logging.info("listing the collections of the source and target JSS")
+    source = _list_names(src_jss)
+    target = _list_names(trg_jss)
+    latencies = [entry[2] for entry in list(source.values()) + list(target.values()) if entry[1]]
+    sample_latencies = list()
+
+    requests = dict(GET=0, POST=0, PUT=0, DELETE=0)
+    received = sum(entry[1] for entry in list(source.values()) + list(target.values()))
+    sent = 0
+    unsampled = False
+    resources = dict()
+    for resource in resource_dependencies:
+        src_names, trg_names = source[resource][0], target[resource][0]
+        size, processed_size, sampled = _sample_objects(src_jss, resource, sorted(src_names.values()), sample)
+        sample_latencies.extend(sampled)
+        existing = len(set(src_names).intersection(trg_names))
+        counts = dict(GET=2 + len(src_names), POST=0, PUT=0, DELETE=0)
+        if mode == 'promote':
+            counts['DELETE'] = len(trg_names)
+            counts['POST'] = len(src_names)
+        elif mode == 'upsert':
+            counts['PUT'] = existing
+            counts['POST'] = len(src_names) - existing
+        else:
+            counts['GET'] += len(trg_names)
+            counts['PUT'] = existing
+            counts['POST'] = len(src_names) - existing
+            counts['DELETE'] = len(set(trg_names).difference(src_names))
+
+        for method, count in counts.items():
+            requests[method] += count
+
+        writes = counts['POST'] + counts['PUT']
+        if size is None:
+            unsampled = unsampled or bool(src_names)
+        else:
+            received += size * (counts['GET'] - 2)
+            sent += processed_size * writes
+
+        resources[resource] = {
+            'source_objects': len(src_names),
+            'target_objects': len(trg_names),
+            'requests': counts,
+            'object_bytes': size,
+            'processed_bytes': processed_size
+        }
+
+    if latency is None:
+        latency = _median(sample_latencies) or _median(latencies) or 0.0
+
+    return {
+        'mode': mode,
+        'requests': requests,
+        'bytes': {'received': None if unsampled else received, 'sent': None if unsampled else sent},
+        'resources': resources,
+        'latency': latency,
+        'duration': dict((count, _project(resources, mode, latency, count)) for count in workers)
+    }
+
+
+def _project(resources, mode, latency, workers):
+    """Returns the projected seconds a promotion takes with a number of workers"""
+    def phase(graph, counts):
+        finish = dict()
+        for resource in dependency_order(graph):
+            objects, requests = counts[resource]
+            own = math.ceil(objects / float(workers)) * (requests / float(objects) if objects else 0) * latency
+            finish[resource] = max([finish[i] for i in graph[resource]] + [0]) + own + latency
+
+        shared = sum(requests for objects, requests in counts.values()) * latency / workers
+        return max(max(finish.values()), shared)
+
+    duration = 0.0
+    if mode != 'upsert':
+        duration += phase(reverse_dependencies(resource_dependencies), dict(
+            (resource, (entry['target_objects'], entry['requests']['DELETE']))
+            for resource, entry in resources.items()))
+
+    duration += phase(resource_dependencies, dict(
+        (resource, (entry['source_objects'], sum(entry['requests'].values()) - entry['requests']['DELETE']))
+        for resource, entry in resources.items()))
+    return duration
+
+
+def format_plan(estimate):
+    """Returns a plan() estimate as readable text"""
+    def size(value):
+        return 'unknown (sample objects to estimate)' if value is None else '{:.1f} MB'.format(value / 1048576.0)
+
+    lines = ["plan for mode '{}':".format(estimate['mode']),
+             '    requests: {}'.format(', '.join('{} {}'.format(estimate['requests'][method], method)
+                                                 for method in ('GET', 'POST', 'PUT', 'DELETE'))),
+             '    received: {}'.format(size(estimate['bytes']['received'])),
+             '    sent: {}'.format(size(estimate['bytes']['sent'])),
+             '    latency: {:.1f}ms per request'.format(estimate['latency'] * 1000)]
+    for workers, seconds in sorted(estimate['duration'].items()):
+        lines.append('    {:>3} workers: {:.0f}m {:02.0f}s'.format(workers, seconds // 60, seconds % 60))
+
+    return '\n'.join(lines)
@@ -1,182 +1,1200 @@
 import logging
-from manifests import manifests, global_exclusions, global_overrides, global_injections, global_collections
+from archives import Archive
+from journal import Journal
+from jsslib import BaseJSS, subsets
+from manifests import manifests, global_exclusions, global_overrides, global_injections, global_collections, \
+    global_dependencies, resource_dependencies
+import manifests as manifest_settings
+from metrics import write_metrics
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from nameindex import NameIndex
+from pipeline import format_stats, Pipeline, Stage
 from requests.exceptions import HTTPError
-import os
-import xml.etree.ElementTree as etree
+from snapshots import Snapshot
+import hashlib
+import threading
+import time
+from xmlbackend import compile_path, compile_remove, compile_strip, etree, fromstring, iselement, tostring
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
 
 __author__ = 'brysontyrrell'
 
 
-def clean_jss(jss):
-    """Iterates over all resources and deletes their objects through the API"""
-    order_of_operations = [
-        # Objects that have scope
-        'ebooks',
-        'mac_applications',
-        'mobile_device_applications',
-        'mobile_device_configuration_profiles',
-        'network_segments',
-        'os_x_configuration_profiles',
-        'peripherals',
-        'policies',
-        # Device and user records
-        'computers',
-        'mobile_devices',
-        'users',
-        # Objects that point to other objects
-        'ldap_servers',
-        'packages',
-        'scripts',
-        # Groups
-        'computer_groups',
-        'mobile_device_groups',
-        'user_groups',
-        # Stand-alone objects
-        'buildings',
-        'categories',
-        'computer_extension_attributes',
-        'departments',
-        'ibeacons',
-        'mobile_device_extension_attributes',
-        'peripheral_types',
-        'printers',
-        'user_extension_attributes'
-    ]
-    for resource in order_of_operations:
-        logging.info("removing all objects from /{}".format(resource))
-        for i in getattr(jss, resource)():
-            getattr(jss, resource)(i, delete=True)
-
-
-def remove_element(root, path):
-    """Removes an element from an ElementTree.Element object"""
-    parent, child = os.path.split(path)
-    try:
-        root.remove(root.find(child)) if not parent else root.find(parent).remove(root.find(path))
-    except (AttributeError, ValueError):
-        logging.info("the element '{}' was not found".format(child))
+def _run_in_pool(pool, func, items):
+    """Calls 'func' for every item: on the pool of threads if one is passed or serially if 'pool' is None"""
+    if pool is None:
+        for i in items:
+            func(i)
     else:
-        logging.info("the element '{}' was removed".format(child))
+        for _ in pool.imap_unordered(func, items):
+            pass
+
+
+def dependency_order(graph):
+    """
+    Returns the resources of a dependency graph in an order where every resource follows the resources it depends on
+        'graph' is a dictionary of resources and the list of resources each one depends on
+        raises a ValueError if the graph has a cycle or depends on a resource that is not in it
+    """
+    waiting = dict((resource, set(dependencies)) for resource, dependencies in graph.items())
+    for resource, dependencies in waiting.items():
+        if not dependencies.issubset(waiting):
+            raise ValueError("'{}' depends on unknown resources: {}".format(
+                resource, ', '.join(sorted(dependencies.difference(waiting)))))
+
+    order = list()
+    while waiting:
+        ready = sorted(resource for resource, dependencies in waiting.items() if not dependencies)
+        if not ready:
+            raise ValueError("dependency cycle between: {}".format(', '.join(sorted(waiting))))
+
+        for resource in ready:
+            del waiting[resource]
+            order.append(resource)
 
+        for dependencies in waiting.values():
+            dependencies.difference_update(ready)
 
-def insert_override_element(root, path, value):
+    return order
+
+
+def reverse_dependencies(graph):
+    """Returns a dependency graph where every resource depends on the resources that depended on it in 'graph'"""
+    reverse = dict((resource, list()) for resource in graph)
+    for resource, dependencies in graph.items():
+        for dependency in dependencies:
+            reverse[dependency].append(resource)
+
+    return reverse
+
+
+def run_dependency_graph(graph, func, workers=1):
     """
-    Inserts an element into an ElementTree.Element object or changes the value of an existing element
-        Child elements will be created for the passed path
+    Calls 'func' for every resource in a dependency graph once the resources it depends on have finished
+        With 'workers' greater than 1 up to that many resources are run at once on a pool of threads, otherwise
+        resources are run one at a time in dependency_order()
+        The first exception raised by 'func' is re-raised once the resources already running have finished
     """
-    children = path.split('/')
-    if root.find(children[0]) is None:
-        logging.info("creating element '{}'".format(children[0]))
-        etree.SubElement(root, children[0])
+    order = dependency_order(graph)
+    if workers <= 1:
+        for resource in order:
+            func(resource)
+
+        return
 
-    for p in range(1, len(children)):
-        parent_path = '/'.join([children[x] for x in range(p)])
-        child_path = '/'.join([children[x] for x in range(p + 1)])
-        if root.find(child_path) is None:
-            logging.info("creating element '{}'".format(children[p]))
-            etree.SubElement(root.find(parent_path), children[p])
+    def run(resource):
+        try:
+            func(resource)
+        except Exception as e:
+            finished.put((resource, e))
+        else:
+            finished.put((resource, None))
+
+    waiting = dict((resource, set(graph[resource])) for resource in order)
+    finished = Queue()
+    running = 0
+    error = None
+    pool = ThreadPool(workers)
+    try:
+        while (waiting and error is None) or running:
+            if error is None:
+                for resource in [r for r in order if r in waiting and not waiting[r]]:
+                    del waiting[resource]
+                    pool.apply_async(run, (resource,))
+                    running += 1
 
-    root.find(path).text = value
+            resource, exception = finished.get()
+            running -= 1
+            if exception is not None and error is None:
+                error = exception
 
+            for dependencies in waiting.values():
+                dependencies.discard(resource)
+    finally:
+        pool.close()
+        pool.join()
+
+    if error is not None:
+        raise error
+
+
+def supported(resource, *jss_list):
+    """Tests if every JSS supports a resource (see jsslib.BaseJSS.supports()) and logs the resources skipped"""
+    for jss in jss_list:
+        if not jss.supports(resource):
+            logging.info("skipping resource not supported by JSS version {}: {}".format(jss.version, resource))
+            return False
+
+    return True
+
+
+class Progress(object):
+    """
+    Thread-safe counter that logs the number and rate of objects processed for a resource
+        'total' may be None when the number of objects is not known up front (e.g. streamed id lists)
+    """
+    def __init__(self, action, resource, total=None, interval=10):
+        self._lock = threading.Lock()
+        self._action = action
+        self._resource = resource
+        self._total = total
+        self._interval = interval
+        self._start = self._last_report = time.time()
+        self.count = 0
+
+    def _report(self, now):
+        elapsed = now - self._start
+        rate = self.count / elapsed if elapsed else 0.0
+        count = self.count if self._total is None else '{}/{}'.format(self.count, self._total)
+        logging.info("{} {} objects from /{} in {:.1f}s ({:.1f}/sec)".format(
+            self._action, count, self._resource, elapsed, rate))
+
+    def increment(self):
+        """Counts a processed object and logs progress at most once every 'interval' seconds"""
+        with self._lock:
+            self.count += 1
+            now = time.time()
+            if now - self._last_report >= self._interval:
+                self._last_report = now
+                self._report(now)
+
+    def finish(self):
+        """Logs the final count and rate"""
+        with self._lock:
+            self._report(time.time())
+
+
+def clean_jss(jss, workers=1, resume=None):
+    """
+    Iterates over all resources and deletes their objects through the API
+        A resource is cleaned once all of the resources that depend on it (see manifests.resource_dependencies) have
+        been cleaned. With 'workers' greater than 1 up to that many resources are cleaned at once and their deletes
+        share a pool of 'workers' threads
+        'resume' is the path of a journal.Journal: every delete is recorded in it and resources that an earlier run
+        finished cleaning are skipped
+    """
+    def clean_resource(resource):
+        if not supported(resource, jss):
+            return
 
-def remove_element_from_collection(root, path, element='id'):
-    """Takes an ElementTree.Element and searches a path for all instances of an element and removes them"""
-    collection = root.find(path)
-    if collection is not None:
-        logging.info("removing '{}' elements from collection: {}".format(element, path))
-        for i in collection.getchildren():
+        if journal is not None and journal.resource_completed('clean', resource):
+            logging.info("skipping resource cleaned by a previous run: {}".format(resource))
+            return
+
+        id_list = getattr(jss, resource)()
+        if isinstance(id_list, list):
+            logging.info("removing {} objects from /{}".format(len(id_list), resource))
+            progress = Progress('deleted', resource, len(id_list))
+        else:
+            logging.info("removing all objects from /{}".format(resource))
+            progress = Progress('deleted', resource)
+
+        def delete(i):
+            deleted = False
             try:
-                i.remove(i.find(element))
-            except ValueError:
-                logging.info("the element '{}' was not found".format(element))
+                getattr(jss, resource)(i, delete=True)
+                deleted = True
+            finally:
+                if journal is not None:
+                    journal.record('clean', resource, i, i, 'done' if deleted else 'failed')
+
+            progress.increment()
+
+        _run_in_pool(pool, delete, id_list)
+        progress.finish()
+        if journal is not None:
+            journal.record_resource('clean', resource)
+
+    journal = None
+    pool = ThreadPool(workers) if workers > 1 else None
+    try:
+        journal = Journal(resume) if resume else None
+        run_dependency_graph(reverse_dependencies(resource_dependencies), clean_resource, workers)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        if journal is not None:
+            journal.close()
+
+
+def _overlaps(path, other):
+    """Tests if two element paths are the same or one contains the other"""
+    return path == other or path.startswith(other + '/') or other.startswith(path + '/')
+
+
+def _walk(root, tags, create=False):
+    """Returns the element at the end of a list of tags (creating missing elements if 'create' is True) or None"""
+    node = root
+    for tag in tags:
+        child = node.find(tag)
+        if child is None:
+            if not create:
+                return None
+
+            child = etree.SubElement(node, tag)
+
+        node = child
+
+    return node
+
+
+def _text_setter(tags, value):
+    """Returns a function that sets the text of the element at the end of a list of tags (creating it if missing)"""
+    find = compile_path(tags)
+
+    def set_text(root):
+        element = find(root)
+        if element is None:
+            element = _walk(root, tags, create=True)
+
+        element.text = value
+
+    return set_text
+
+
+class ManifestPlan(object):
+    """
+    The global manifest and the manifest for a resource compiled into one list of actions
+        The actions are applied in the order process_xml() has always used (exclude, override, inject, collections)
+        with each path split into its tags and compiled once (see xmlbackend). Actions that would repeat an earlier
+        one are dropped: a second override or injection of the same path updates the value of the first, and an
+        element that has already been excluded is not excluded again or searched for a collection
+        'subset' is the list of sections to GET for resources that support subsets (see jsslib.subsets) when
+        manifests.fetch_subsets is True and the manifests exclude whole sections of the object - the excluded
+        sections are not downloaded, nor are sections jsslib.subsets does not list. None otherwise
+        'dependencies' is a list of the compiled paths of the elements that link to other objects and the resource
+        of those objects (see find_dependencies())
+        'injected' is a list of the compiled paths of the elements the manifests inject - write-only values such as
+        passwords that the JSS does not return, so they are left out when objects are compared (see sync_jss())
+        Pass 'manifest' to compile only that manifest in place of the global manifest and the manifest for the
+        resource (e.g. the changes a Target makes to objects that have already been processed) - any of its keys
+        can be left out
+    """
+    def __init__(self, resource, manifest=None):
+        """Initialize the ManifestPlan class"""
+        self.resource = resource
+        self.actions = list()
+        shared = manifest is None
+        if shared:
+            manifest = manifests.get(resource)
+            if manifest is None:
+                logging.info("there is no manifest for the object: {}".format(resource))
+
+            sources = [(global_exclusions, global_overrides, global_injections, global_collections)]
+            references = dict(global_dependencies)
+        else:
+            sources = list()
+            references = dict()
+
+        injected = set()
+        if manifest:
+            sources.append((manifest.get('exclude', []), manifest.get('override', {}), manifest.get('inject', {}),
+                            manifest.get('collections', [])))
+            references.update(manifest.get('dependencies', {}))
+
+        for exclude, override, inject, collections in sources:
+            for path in exclude:
+                self._add('exclude', path)
+
+            for path, value in override.items():
+                self._add('set', path, value)
+
+            for path, value in inject.items():
+                self._add('set', path, value)
+                injected.add(path)
+
+            for path in collections:
+                self._add('collection', path)
+
+        self._steps = self._compile()
+        self.dependencies = [(compile_path(path.split('/')), dependency)
+                             for path, dependency in sorted(references.items())]
+        self.injected = [compile_path(path.split('/')) for path in sorted(injected)]
+        self.subset = None
+        excluded = set(path for action, path, tags, value in self.actions if action == 'exclude' and '/' not in path)
+        if shared and excluded.intersection(element for name, element in subsets.get(resource, [])):
+            if manifest_settings.fetch_subsets:
+                self.subset = [name for name, element in subsets[resource] if element not in excluded]
+                logging.info("requesting only the sections {} of {}: omitting {} and any section jsslib.subsets "
+                             "does not list".format(', '.join(self.subset), resource, ', '.join(
+                                 name for name, element in subsets[resource] if element in excluded)))
+            else:
+                logging.debug("requesting whole objects of {} (see manifests.fetch_subsets)".format(resource))
 
+    def _add(self, action, path, value=None):
+        """Appends an action to the plan unless it repeats an earlier one"""
+        for i in range(len(self.actions) - 1, -1, -1):
+            earlier_action, earlier_path = self.actions[i][:2]
+            if not _overlaps(path, earlier_path):
+                continue
+
+            if action == 'set' and earlier_action == 'set' and path == earlier_path:
+                self.actions[i] = self.actions[i][:3] + (value,)
+                return
+            elif action != 'set' and earlier_action == 'exclude' and (
+                    path == earlier_path or path.startswith(earlier_path + '/')):
+                return
+
+            break
+
+        tags = path.split('/')
+        if action == 'exclude':
+            self.actions.append((action, path, (tags[:-1], tags[-1]), value))
+        else:
+            self.actions.append((action, path, tags, value))
+
+    def _compile(self):
+        """
+        Returns the actions as a list of functions that apply them to an element
+            consecutive exclusions are made by one function (one XPath query with lxml - see xmlbackend)
+        """
+        steps = list()
+        excluded = list()
+        for action, path, tags, value in self.actions:
+            if action == 'exclude':
+                excluded.append(tags[0] + [tags[1]])
+                continue
+
+            if excluded:
+                steps.append(compile_remove(excluded))
+                excluded = list()
+
+            if action == 'set':
+                steps.append(_text_setter(tags, value))
+            else:
+                steps.append(compile_strip(tags, 'id'))
+
+        if excluded:
+            steps.append(compile_remove(excluded))
+
+        return steps
+
+    def apply(self, root):
+        """Applies the plan to an ElementTree.Element object in place"""
+        for step in self._steps:
+            step(root)
+
+        return root
+
+
+def _linked_names(element):
+    """Returns the names of the objects an element links to (see manifests.py for the forms a link can take)"""
+    if element.find('name') is not None:
+        names = [element.findtext('name')]
+    elif len(element):
+        names = [child.findtext('name') for child in element]
     else:
-        logging.info("the collection '{}' was not found".format(path))
+        names = [element.text]
+
+    return [name.strip() for name in names if name and name.strip()]
+
+
+_plans = dict()
+
+
+def compile_manifest(resource):
+    """
+    Returns the ManifestPlan for a resource - plans are compiled on first use and reused for every object
+        manifests.fetch_subsets is read each time so a plan compiled before it was changed is not reused
+    """
+    key = (resource, manifest_settings.fetch_subsets)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _plans[key] = ManifestPlan(resource)
+
+    return plan
+
+
+def find_dependencies(root, resource):
+    """
+    Returns a list of (resource, name) for every object a processed object links to
+        The elements listed in the 'dependencies' of the global manifest and the manifest of the resource are read
+        from the ElementTree.Element returned by process_xml() so only links that survive the manifest are returned
+    """
+    found = list()
+    for find, dependency in compile_manifest(resource).dependencies:
+        element = find(root)
+        if element is not None:
+            for name in _linked_names(element):
+                if (dependency, name) not in found:
+                    found.append((dependency, name))
+
+    return found
+
+
+def fetch_object(jss, resource, id_name):
+    """Returns the XML of an object requesting only the sections its manifest does not exclude (see ManifestPlan)"""
+    subset = compile_manifest(resource).subset
+    if subset:
+        return getattr(jss, resource)(id_name, subset=subset)
+
+    return getattr(jss, resource)(id_name)
+
+
+def process_xml(data, obj_type, metrics=None):
+    """
+    Takes an XML string and returns an element that has had a manifest applied
+        The element is from the library xmlbackend uses (lxml when it is installed) - serialize it with
+        xmlbackend.tostring() (or pass it to jsslib as it is)
+        If no manifest exists for the object type only the global manifest is applied
+        The time taken is recorded in 'metrics' (a metrics.Metrics) if one is passed
+    """
+    if metrics is None:
+        return compile_manifest(obj_type).apply(fromstring(data))
+
+    start = time.time()
+    root = compile_manifest(obj_type).apply(fromstring(data))
+    metrics.parse(obj_type, 'process_xml', time.time() - start)
+    return root
+
+
+def _init_transform_worker():
+    """Compiles the manifests of every resource when a TransformPool worker process starts"""
+    for resource in resource_dependencies:
+        compile_manifest(resource)
+
+
+def transform_xml(data, resource):
+    """
+    Applies the manifest of a resource to the XML of an object (run in a TransformPool worker process)
+        returns the processed XML (bytes), the name of the object and the seconds it took
+    """
+    start = time.time()
+    root = process_xml(data, resource)
+    return tostring(root), BaseJSS._object_name(root), time.time() - start
+
+
+class TransformPool(object):
+    """
+    A pool of worker processes that apply the manifests to objects
+        Parsing, applying the manifest and serializing large records (computers, policies) holds the GIL - with many
+        threads fetching objects that work becomes the limit. A TransformPool moves it to 'processes' worker
+        processes (the number of CPUs if None) that have the manifests compiled: XML bytes are sent to a worker and
+        the processed XML bytes are sent back while the requests stay on threads
+
+    transform() can be called from any thread and blocks until a worker has processed the object
+    """
+    def __init__(self, processes=None):
+        """Initialize the TransformPool class"""
+        self._pool = multiprocessing.Pool(processes, _init_transform_worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def transform(self, data, resource, metrics=None):
+        """
+        Returns the processed XML (bytes) and the name of an object
+            The time the worker took is recorded in 'metrics' (a metrics.Metrics) if one is passed
+        """
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+
+        xml, name, seconds = self._pool.apply(transform_xml, (data, resource))
+        if metrics is not None:
+            metrics.parse(resource, 'process_xml', seconds)
+
+        return xml, name
+
+    def close(self):
+        """Stops the worker processes"""
+        self._pool.close()
+        self._pool.join()
+
+
+def _post_object(trg_jss, resource, id_name, new_object):
+    """
+    POSTs a processed object to the target JSS - returns the id of the new object or None if it was not promoted
+        a 409 (the JSS rejected the object) is logged, any other HTTPError is raised
+    """
+    try:
+        return getattr(trg_jss, resource)(data=new_object)
+    except HTTPError as e:
+        if e.response.status_code == 409:
+            logging.warning(str(e))
+            logging.debug('response error message: {}'.format(e.response.text))
+            logging.warning("the object '{} {}' has not been promoted".format(resource, id_name))
+        else:
+            raise
+
+
+def _upsert_processed(trg_jss, index, resource, id_name, new_object, name):
+    """
+    PUTs a processed object over the object of the same name on the target JSS or POSTs it if there is none
+        'index' is a nameindex.NameIndex of the target JSS and is updated with the id of the written object
+        A 409 on a POST reloads the index for the resource and PUTs to the object if it is now found by name, a 404
+        on a PUT (the index was stale) falls back to a POST
+        returns the id of the object on the target JSS or None if it was not promoted
+    """
+    write = getattr(trg_jss, resource)
+    obj_id = index.lookup(resource, name) if name else None
+    try:
+        try:
+            obj_id = write(obj_id, data=new_object) if obj_id is not None else write(data=new_object)
+        except HTTPError as e:
+            if e.response.status_code == 409 and obj_id is None and name:
+                obj_id = index.reload(resource).get(name)
+                if obj_id is None:
+                    raise
+
+                logging.info("the object '{} {}' already exists: updating id {}".format(resource, name, obj_id))
+                obj_id = write(obj_id, data=new_object)
+            elif e.response.status_code == 404 and obj_id is not None:
+                logging.info("the object '{} {}' is no longer at id {}: creating it".format(resource, name, obj_id))
+                index.forget(resource, name)
+                obj_id = write(data=new_object)
+            else:
+                raise
+    except HTTPError as e:
+        if e.response.status_code == 409:
+            logging.warning(str(e))
+            logging.debug('response error message: {}'.format(e.response.text))
+            logging.warning("the object '{} {}' has not been promoted".format(resource, id_name))
+            return None
+        else:
+            raise
 
+    if name and obj_id is not None:
+        index.record(resource, name, obj_id)
 
-def process_xml(data, obj_type):
+    return obj_id
+
+
+def _break_cycles(graph):
+    """
+    Removes the links that close a cycle from a dependency graph of objects (in place) so dependency_order() can
+        order it - each removed link is logged: the object it starts from is written before the object it links to
+    """
+    visiting, visited = set(), set()
+    for start in sorted(graph):
+        if start in visited:
+            continue
+
+        visiting.add(start)
+        stack = [(start, iter(list(graph[start])))]
+        while stack:
+            key, dependencies = stack[-1]
+            for dependency in dependencies:
+                if dependency in visiting:
+                    graph[key].remove(dependency)
+                    logging.warning("the link from '{} {}' to '{} {}' closes a dependency cycle: '{} {}' is written "
+                                    "first and the link may not resolve".format(key[0], key[1], dependency[0],
+                                                                                dependency[1], key[0], key[1]))
+                elif dependency not in visited:
+                    visiting.add(dependency)
+                    stack.append((dependency, iter(list(graph[dependency]))))
+                    break
+            else:
+                visiting.discard(key)
+                visited.add(key)
+                stack.pop()
+
+
+def promote_objects(src_jss, trg_jss, resource, ids_or_names, index_path=None):
     """
-    Takes an XML string and returns an ElementTree.Element object that has had a manifest applied
-        If no manifest exists for the object type it returned the ElementTree.Element object
+    Promotes individual objects of a resource and the objects they depend on that are missing from the target JSS
+        'ids_or_names' is a list of ids and/or names of objects on the source JSS. Every object is processed and
+        the objects it links to are found with find_dependencies(): linked objects that are already on the target
+        JSS (by name) are left as they are, the rest are fetched from the source JSS and their links followed in
+        turn. The objects found this way are then written in dependency order so every link resolves when its
+        object is written. Objects are matched by name with surrounding whitespace removed and each one is fetched
+        once. Objects that link to each other in a cycle are logged and written in the order the cycle was found
+        The requested objects are always written: PUT over the object of the same name on the target JSS or POSTed
+        if there is none (see _upsert_processed()). Links to objects that are not on the source JSS or to resources
+        either JSS does not support are logged and skipped
+        The name index of the target JSS is read from and saved to 'index_path' if one is passed
+    returns a list of (resource, name, target id) for the objects written in the order they were written - the id
+        is None for an object that was not promoted
     """
-    src_root = etree.fromstring(data)
+    sources = NameIndex(src_jss)
+    index = NameIndex(trg_jss, index_path)
+    graph = dict()
+    objects = dict()
+    requested = set()
+    queue = list()
+    for i in ids_or_names:
+        name = sources.name(resource, i) if src_jss._is_int(i) else i
+        queue.append(((resource, name.strip()) if name else None, resource, i, True))
+
+    queued = set(item[0] for item in queue)
+    while queue:
+        key, obj_resource, id_name, is_requested = queue.pop(0)
+        if key is None or key not in objects:
+            root = process_xml(fetch_object(src_jss, obj_resource, id_name), obj_resource, src_jss._metrics)
+            key = key or (obj_resource, (BaseJSS._object_name(root) or '').strip())
+
+        if is_requested:
+            requested.add(key)
+
+        if key in objects:
+            continue
+
+        objects[key] = root
+        graph[key] = list()
+        for dependency in find_dependencies(root, obj_resource):
+            dep_resource, name = dependency
+            if dependency == key or not supported(dep_resource, src_jss, trg_jss):
+                continue
+            elif dependency not in objects and dependency not in queued and \
+                    index.lookup(dep_resource, name) is not None:
+                logging.debug("the object '{} {}' is already on the target JSS".format(dep_resource, name))
+                continue
+
+            if dependency not in objects and dependency not in queued:
+                src_id = sources.lookup(dep_resource, name)
+                if src_id is None:
+                    logging.info("the object '{} {}' linked from '{} {}' is not on the source JSS".format(
+                        dep_resource, name, obj_resource, key[1]))
+                    continue
+
+                queue.append((dependency, dep_resource, src_id, False))
+                queued.add(dependency)
+
+            graph[key].append(dependency)
+
+    _break_cycles(graph)
+    logging.info("promoting {} objects for {} requested objects of /{}".format(
+        len(objects), len(ids_or_names), resource))
+    promoted = list()
     try:
-        manifest = manifests[obj_type]
-    except KeyError:
-        logging.info("there is no manifest for the object: {}".format(obj_type))
-        manifest = None
-
-    for element in global_exclusions:
-        remove_element(src_root, element)
-
-    for element, value in global_overrides.iteritems():
-        insert_override_element(src_root, element, value)
-
-    for element, value in global_injections.iteritems():
-        insert_override_element(src_root, element, value)
-
-    for element in global_collections:
-        remove_element_from_collection(src_root, element)
-
-    if manifest:
-        for element in manifest['exclude']:
-            remove_element(src_root, element)
-
-        for element, value in manifest['override'].iteritems():
-            insert_override_element(src_root, element, value)
-
-        for element, value in manifest['inject'].iteritems():
-            insert_override_element(src_root, element, value)
-
-        for element in manifest['collections']:
-            remove_element_from_collection(src_root, element)
-
-    return src_root
-
-
-def promote_jss(src_jss, trg_jss):
-    order_of_operations = [
-        # Stand-alone objects
-        'buildings',
-        'categories',
-        'computer_extension_attributes',
-        'departments',
-        'ibeacons',
-        'mobile_device_extension_attributes',
-        'peripheral_types',
-        'printers',
-        'user_extension_attributes',
-        # Objects that point to other objects
-        'ldap_servers',
-        'packages',
-        'scripts',
-        # Device and user records
-        'users',
-        'computers',
-        'mobile_devices',
-        # Groups
-        'computer_groups',
-        'mobile_device_groups',
-        'user_groups',
-        # Objects that have scope
-        'ebooks',
-        'mac_applications',
-        'mobile_device_applications',
-        'mobile_device_configuration_profiles',
-        'network_segments',
-        'os_x_configuration_profiles',
-        'peripherals',
-        'policies'
-    ]
-    for resource in order_of_operations:
-        logging.info("promoting resource: {}".format(resource))
+        for key in dependency_order(graph):
+            obj_resource, name = key
+            if key in requested:
+                obj_id = _upsert_processed(trg_jss, index, obj_resource, name, objects[key], name)
+            else:
+                obj_id = _post_object(trg_jss, obj_resource, name, objects[key])
+                if obj_id is not None and name:
+                    index.record(obj_resource, name, obj_id)
+
+            promoted.append((obj_resource, name, obj_id))
+    finally:
+        if index_path:
+            index.save(index_path)
+
+    return promoted
+
+
+def _metrics_snapshots(src_jss, trg_list):
+    """
+    Returns the metrics snapshots of the source and target JSSs by name (objects without metrics are left out)
+        the target is named 'target' or, with more than one, 'target1', 'target2'...
+    """
+    snapshots = dict()
+    if src_jss._metrics is not None and all(src_jss._metrics is not jss._metrics for jss in trg_list):
+        snapshots['source'] = src_jss._metrics.snapshot()
+
+    for n, jss in enumerate(trg_list):
+        if jss._metrics is not None:
+            snapshots['target{}'.format(n + 1) if len(trg_list) > 1 else 'target'] = jss._metrics.snapshot()
+
+    return snapshots
+
+
+class Target(object):
+    """
+    A target JSS of promote_jss() with its own changes to the objects promoted to it
+        'manifest' is a dictionary of resources to manifests in the format of manifests.manifests (any of the keys
+        can be left out) that are applied to the objects of the resource after the shared manifests - e.g. a
+        different 'ldap_servers' account for every target
+        'index_path' and 'resume' are the name index and journal of this target (see promote_jss())
+
+    During a promotion 'error' is the exception that stopped the promotion to this target or None
+    """
+    def __init__(self, jss, manifest=None, index_path=None, resume=None):
+        """Initialize the Target class"""
+        self.jss = jss
+        self.manifest = manifest or dict()
+        self.index_path = index_path
+        self.resume = resume
+        self.error = None
+        self.plans = dict()
+        self.index = None
+        self.journal = None
+        self.resources = dict()
+        self.failures = dict()
+
+    @property
+    def failed(self):
+        """Tests if the promotion to this target has stopped"""
+        return self.error is not None
+
+    def open(self, upsert):
+        """Prepares the target for a promotion: compiles its manifests and opens its name index and journal"""
+        self.error = None
+        self.plans = dict((resource, ManifestPlan(resource, manifest)) for resource, manifest in self.manifest.items())
+        self.index = NameIndex(self.jss, self.index_path) if upsert else None
+        self.journal = Journal(self.resume) if self.resume else None
+        self.resources = dict()
+        self.failures = dict()
+
+    def close(self):
+        """Saves the name index and closes the journal of the target (the journal is closed even if saving fails)"""
+        try:
+            if self.index is not None and self.index_path:
+                self.index.save(self.index_path)
+        finally:
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+    def start(self, resource):
+        """
+        Returns True if the objects of a resource are to be promoted to this target and keeps the ids of the objects
+            an earlier run promoted - False if the target does not support the resource or the journal shows it done
+        """
+        if not supported(resource, self.jss):
+            return False
+
+        completed = dict()
+        if self.journal is not None:
+            if self.journal.resource_completed('promote', resource):
+                logging.info("skipping resource promoted to {} by a previous run: {}".format(self.jss._url, resource))
+                return False
+
+            completed = self.journal.completed('promote', resource)
+            self.failures[resource] = 0
+
+        logging.info("promoting resource to {}: {} ({} objects already promoted)".format(
+            self.jss._url, resource, len(completed)))
+        self.resources[resource] = completed
+        return True
+
+    def wants(self, resource, i):
+        """Tests if an object is still to be promoted to this target"""
+        completed = self.resources.get(resource)
+        return not self.failed and completed is not None and str(i) not in completed
+
+    def fail(self, error):
+        """Stops the promotion to this target"""
+        if self.error is None:
+            logging.exception("promoting to {} failed: no more objects will be written to it".format(self.jss._url))
+            self.error = error
+
+
+def promote_jss(src_jss, trg_jss, workers=1, upsert=False, index_path=None, resume=None, metrics_path=None,
+                processes=0, fetch_workers=None, transform_workers=None, push_workers=None, queue_depth=None):
+    """
+    Promotes all objects from the source JSS to the target JSS
+        The objects pass through a pipeline.Pipeline of three stages: 'fetch' (GET from the source JSS on
+        'fetch_workers' threads), 'transform' (apply the manifest on 'transform_workers' threads) and 'push' (POST
+        or PUT to the target JSS on 'push_workers' threads). The stages run at the same time and are connected by
+        queues of at most 'queue_depth' objects so reads from the source overlap writes to the target and no more
+        than that many objects are held between any two stages. 'fetch_workers' and 'push_workers' default to
+        'workers', 'transform_workers' to 'processes' (or 1) and 'queue_depth' to four times the most threads of a
+        stage
+        The objects of a resource are read once all of the resources it depends on (see
+        manifests.resource_dependencies) have been pushed
+        'src_jss' may be a snapshots.Snapshot (see snapshot()) in place of a live JSS
+        'trg_jss' may be a list of target JSSs and/or Targets (a Target has its own manifest changes, name index and
+        journal): every object is fetched and processed once and written to all of the targets, each of which has
+        'push_workers' threads. An error writing to one target (other than a 409 for an object) stops the promotion
+        to that target only - the other targets carry on and the error is raised at the end if every target failed
+        With 'upsert' True objects that already exist on the target JSS are updated in place (see _upsert_processed())
+        so the target does not need to be cleaned first. The name index of the target JSS is read from and saved
+        to 'index_path' if one is passed
+        'resume' is the path of a journal.Journal: the source id, target id and status of every object is recorded
+        in it and objects (and resources) that an earlier run promoted are skipped - failed objects are tried again.
+        Use 'upsert' when resuming so objects created by a POST that was not recorded before the run died are updated
+        'index_path' and 'resume' are for a single target - use Targets to keep them for several
+        The metrics of the source and target JSS are written to 'metrics_path' at the end if one is passed (a
+        Prometheus textfile if it ends with '.prom', JSON otherwise - see metrics.write_metrics())
+        With 'processes' greater than 0 the manifests are applied in a TransformPool of that many processes so large
+        records are processed on every core
+
+    returns the stats() of the pipeline: a 'full' queue before a stage or an 'empty' queue after it shows that stage
+        is the bottleneck (e.g. 'fetch->transform' empty and 'transform->push' empty: the source JSS is the limit)
+        'targets' is added with the url and error (None if it succeeded) of every target
+    """
+    if isinstance(trg_jss, (list, tuple)):
+        if (index_path or resume) and len(trg_jss) > 1:
+            raise ValueError("pass a Target for each target JSS to keep a name index or journal for it")
+
+        targets = [i if isinstance(i, Target) else Target(i, index_path=index_path, resume=resume) for i in trg_jss]
+    else:
+        targets = [Target(trg_jss, index_path=index_path, resume=resume)]
+
+    fetch_workers = fetch_workers or workers
+    transform_workers = transform_workers or processes or 1
+    push_workers = push_workers or workers
+    queue_depth = queue_depth or 4 * max(fetch_workers, transform_workers, push_workers * len(targets))
+
+    transforms = None
+    condition = threading.Condition()
+    pending = dict()
+    listed = set()
+    done = set()
+
+    def finish(resource):
+        """Marks a resource done once it is listed and all of its objects have been pushed to every target"""
+        if resource in listed and not pending.get(resource):
+            done.add(resource)
+            for target in targets:
+                if target.journal is not None and not target.failed and target.failures.get(resource) == 0:
+                    target.journal.record_resource('promote', resource)
+
+            condition.notify_all()
+
+    def list_resource(resource):
+        """Yields the ids of the objects of a resource that need to be promoted to at least one target"""
+        if not supported(resource, src_jss):
+            return
+
+        receivers = [target for target in targets if not target.failed and target.start(resource)]
+        if not receivers:
+            return
+
         for i in getattr(src_jss, resource)():
-            xml = getattr(src_jss, resource)(i)
-            new_object = process_xml(xml, resource)
+            if any(target.wants(resource, i) for target in receivers):
+                yield i
+
+    def objects():
+        """Yields (resource, id) for every object in dependency order as the resources become ready"""
+        waiting = dependency_order(resource_dependencies)
+        while waiting:
+            with condition:
+                ready = [r for r in waiting if all(d in done for d in resource_dependencies[r])]
+                if not ready:
+                    if pipeline.failed:
+                        return
+
+                    condition.wait(1)
+                    continue
+
+            resource = ready[0]
+            waiting.remove(resource)
+            for i in list_resource(resource):
+                if all(target.failed for target in targets):
+                    return
+
+                with condition:
+                    pending[resource] = pending.get(resource, 0) + 1
+
+                yield resource, i
+
+            with condition:
+                listed.add(resource)
+                finish(resource)
+
+    def fetch(item):
+        resource, i = item
+        return resource, i, fetch_object(src_jss, resource, i)
+
+    def transform(item):
+        """Processes an object once and returns an item for each target it is written to"""
+        resource, i, xml = item
+        if transforms is not None:
+            new_object, name = transforms.transform(xml, resource, src_jss._metrics)
+        else:
+            new_object = process_xml(xml, resource, src_jss._metrics)
+            name = BaseJSS._object_name(new_object)
+
+        receivers = [target for target in targets if target.wants(resource, i)]
+        if len(receivers) > 1 or any(resource in target.plans for target in receivers):
+            # Each target is given its own copy: the shared XML is serialized once and parsed again for the targets
+            # that change it
+            new_object = tostring(new_object) if iselement(new_object) else new_object
+
+        items = list()
+        for target in receivers:
+            plan = target.plans.get(resource)
+            if plan is not None:
+                root = plan.apply(fromstring(new_object))
+                items.append((target, resource, i, root, BaseJSS._object_name(root)))
+            else:
+                items.append((target, resource, i, new_object, name))
+
+        with condition:
+            pending[resource] += len(items) - 1
+            finish(resource)
+
+        return items
+
+    def push(item):
+        target, resource, i, new_object, name = item
+        obj_id = None
+        attempted = not target.failed
+        try:
+            if not attempted:
+                return
+            elif target.index is not None:
+                obj_id = _upsert_processed(target.jss, target.index, resource, i, new_object, name)
+            else:
+                obj_id = _post_object(target.jss, resource, i, new_object)
+        except Exception as e:
+            with condition:
+                target.fail(e)
+
+            attempted = False
+        finally:
+            with condition:
+                if target.journal is not None and attempted:
+                    target.journal.record('promote', resource, i, obj_id, 'done' if obj_id is not None else 'failed')
+                    if obj_id is None:
+                        target.failures[resource] += 1
+
+                pending[resource] -= 1
+                finish(resource)
+
+    pipeline = Pipeline([Stage('fetch', fetch, fetch_workers),
+                         Stage('transform', transform, transform_workers, fan_out=True),
+                         Stage('push', push, push_workers * len(targets))], queue_depth)
+    try:
+        for target in targets:
+            target.open(upsert)
+
+        transforms = TransformPool(processes) if processes else None
+        stats = pipeline.run(objects())
+        stats['targets'] = [{'url': target.jss._url, 'error': str(target.error) if target.failed else None}
+                            for target in targets]
+        logging.info(format_stats(stats))
+        for target in targets:
+            if target.failed:
+                logging.error("promoting to {} failed: {}".format(target.jss._url, target.error))
+
+        if all(target.failed for target in targets):
+            raise targets[0].error
+
+        return stats
+    finally:
+        try:
+            if transforms is not None:
+                transforms.close()
+        finally:
+            for target in targets:
+                target.close()
+
+        if metrics_path:
+            write_metrics(metrics_path, _metrics_snapshots(src_jss, [target.jss for target in targets]))
+
+
+def _normalized_hash(root, skip=()):
+    """
+    Returns a hash of an ElementTree.Element that only depends on its content
+        Tags, sorted attributes and text with surrounding whitespace removed are hashed so differences in the
+        formatting of the XML between two JSSs do not count as changes
+        Elements in 'skip' are left out together with their children
+    """
+    digest = hashlib.sha1()
+    stack = [root]
+    while stack:
+        element = stack.pop()
+        if element is None:
+            digest.update(b'\x00/')
+            continue
+
+        if skip and any(element is i for i in skip):
+            continue
+
+        attributes = u''.join(u'{}={};'.format(k, v) for k, v in sorted(element.attrib.items()))
+        digest.update(u'\x00<{} {}>{}'.format(element.tag, attributes, (element.text or '').strip()).encode('utf-8'))
+        stack.append(None)
+        stack.extend(reversed(list(element)))
+
+    return digest.hexdigest()
+
+
+def _sync_hash(root, resource):
+    """Returns _normalized_hash() of a processed object without the elements its manifests inject"""
+    skip = [find(root) for find in compile_manifest(resource).injected]
+    return _normalized_hash(root, [element for element in skip if element is not None])
+
+
+def sync_jss(src_jss, trg_jss, workers=1, state_path=None):
+    """
+    Updates the target JSS to match the source JSS without cleaning it first
+        Source and target objects are matched by name and compared by a hash of their XML once both have been run
+        through process_xml(): changed objects are PUT, new objects are POSTed and objects that are no longer on the
+        source JSS are DELETEd
+        The elements the manifests inject are left out of the hash - they hold write-only values (e.g. passwords)
+        that the JSS does not return, so they can not be compared and a change to them alone is not synced
+        Names are expected to be unique: when source objects share a name only the first one read is synced and the
+        others are logged (target objects that share a name are logged by JSS.names())
+        Resources are created and updated in dependency order (see promote_jss()) and stale objects are deleted
+        afterwards in the reverse order (see clean_jss())
+        'state_path' is the path of a journal.Journal that keeps the target id and the hash of every synced object
+        for the next run. An object that is still on the target with the same id is then not fetched from the
+        target: it is unchanged if the hash of its source is the same as before and PUT otherwise. Changes made to
+        those objects directly on the target JSS are not detected - remove the journal to compare every object again
+        Create both JSSs with 'return_bytes' True so the objects are parsed without being decoded first
+    returns a dictionary of resources and the number of objects 'created', 'updated', 'deleted' and 'unchanged'
+    """
+    lock = threading.Lock()
+    summary = dict((resource, dict(created=0, updated=0, deleted=0, unchanged=0)) for resource in resource_dependencies)
+    stale = dict()
+
+    def count(resource, result):
+        with lock:
+            summary[resource][result] += 1
+
+    def sync_resource(resource):
+        stale[resource] = list()
+        if not supported(resource, src_jss, trg_jss):
+            return
+
+        logging.info("syncing resource: {}".format(resource))
+        targets = trg_jss.names(resource)
+        previous = journal.synced(resource) if journal is not None else dict()
+        seen = dict()
+        synced = dict()
+
+        def changed(target_id, digest):
+            root = process_xml(fetch_object(trg_jss, resource, target_id), resource, trg_jss._metrics)
+            return _sync_hash(root, resource) != digest
+
+        def sync_object(i):
+            root = process_xml(fetch_object(src_jss, resource, i), resource, src_jss._metrics)
+            name = BaseJSS._object_name(root)
+            digest = _sync_hash(root, resource)
+            with lock:
+                if name in seen:
+                    logging.warning("the objects '{} {}' and '{} {}' have the same name '{}': only the first is "
+                                    "synced".format(resource, seen[name], resource, i, name))
+                    return
+
+                seen[name] = i
+                target_id = targets.pop(name, None)
+
             try:
-                getattr(trg_jss, resource)(data=new_object)
+                if target_id is None:
+                    target_id = getattr(trg_jss, resource)(data=root)
+                    result = 'created'
+                elif previous.get(name) == (target_id, digest):
+                    result = 'unchanged'
+                elif name in previous and previous[name][0] == target_id or changed(target_id, digest):
+                    getattr(trg_jss, resource)(target_id, data=root)
+                    result = 'updated'
+                else:
+                    result = 'unchanged'
             except HTTPError as e:
                 if e.response.status_code == 409:
-                    logging.warning(e.message)
+                    logging.warning(str(e))
                     logging.debug('response error message: {}'.format(e.response.text))
-                    logging.warning("the object '{} {}' has not been promoted".format(resource, i))
+                    logging.warning("the object '{} {}' has not been synced".format(resource, i))
+                    return
+                else:
+                    raise
+
+            count(resource, result)
+            if target_id is not None:
+                with lock:
+                    synced[name] = (int(target_id), digest)
+
+        _run_in_pool(pool, sync_object, getattr(src_jss, resource)())
+        stale[resource] = list(targets.values())
+        if journal is not None:
+            journal.record_synced(resource, synced)
+
+    def delete_stale(resource):
+        if stale[resource]:
+            logging.info("removing {} stale objects from /{}".format(len(stale[resource]), resource))
+
+        def delete(i):
+            getattr(trg_jss, resource)(i, delete=True)
+            count(resource, 'deleted')
+
+        _run_in_pool(pool, delete, stale[resource])
+
+    journal = None
+    pool = ThreadPool(workers) if workers > 1 else None
+    try:
+        journal = Journal(state_path) if state_path else None
+        run_dependency_graph(resource_dependencies, sync_resource, workers)
+        run_dependency_graph(reverse_dependencies(resource_dependencies), delete_stale, workers)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        if journal is not None:
+            journal.close()
+
+    return summary
+
+
+def snapshot(src_jss, path, workers=1):
+    """
+    Stores every object on the source JSS in a snapshots.Snapshot at 'path' and returns it
+        Anything already in the snapshot is removed first. The snapshot can be passed to promote_jss() in place of
+        the source JSS. With 'workers' greater than 1 resources and objects are fetched in parallel
+    """
+    def snapshot_resource(resource):
+        if not supported(resource, src_jss):
+            return
+
+        logging.info("storing resource: {}".format(resource))
+        _run_in_pool(pool, getattr(src_jss, resource), getattr(src_jss, resource)())
+
+    store = Snapshot(path)
+    store.clear()
+    store.version = src_jss.version
+    previous_snapshot, src_jss.snapshot = src_jss.snapshot, store
+    pool = ThreadPool(workers) if workers > 1 else None
+    try:
+        run_dependency_graph(dict((resource, []) for resource in resource_dependencies), snapshot_resource, workers)
+    finally:
+        src_jss.snapshot = previous_snapshot
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return store
+
+
+def export_jss(jss, archive_path, processed=False, workers=1):
+    """
+    Writes every object on a JSS to an archives.Archive at 'archive_path' and returns the number of objects written
+        With 'processed' True the objects are run through process_xml() first (and only the sections the manifests
+        keep are requested from the JSS) so the archive holds exactly what promote_jss() would POST
+        With 'workers' greater than 1 resources and objects are fetched in parallel
+    """
+    def export_object(resource, i):
+        if processed:
+            root = process_xml(fetch_object(jss, resource, i), resource, jss._metrics)
+            archive.add(resource, i, BaseJSS._object_name(root), tostring(root, 'utf-8'))
+        else:
+            xml = getattr(jss, resource)(i)
+            archive.add(resource, i, BaseJSS._object_name(xml), xml)
+
+    def export_resource(resource):
+        if not supported(resource, jss):
+            return
+
+        logging.info("exporting resource: {}".format(resource))
+        _run_in_pool(pool, lambda i: export_object(resource, i), getattr(jss, resource)())
+
+    archive = Archive(archive_path, 'w')
+    archive.version = jss.version
+    archive.processed = processed
+    pool = ThreadPool(workers) if workers > 1 else None
+    try:
+        run_dependency_graph(dict((resource, []) for resource in resource_dependencies), export_resource, workers)
+    finally:
+        archive.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return sum(len(archive.ids(resource)) for resource in resource_dependencies)
+
+
+def import_archive(archive_path, trg_jss, workers=1, upsert=False, index_path=None, resume=None, metrics_path=None,
+                   processes=0):
+    """
+    Promotes all objects in an archives.Archive written by export_jss() to the target JSS
+        The objects are read from the archive one at a time and promoted the same way as promote_jss() (which
+        takes the same 'workers', 'upsert', 'index_path', 'resume', 'metrics_path' and 'processes' options).
+        Applying the manifests to an archive of processed objects again leaves them unchanged
+    """
+    with Archive(archive_path, return_bytes=True) as archive:
+        logging.info("importing archive of JSS version {}: {}".format(archive.version, archive_path))
+        promote_jss(archive, trg_jss, workers=workers, upsert=upsert, index_path=index_path, resume=resume,
+                    metrics_path=metrics_path, processes=processes)
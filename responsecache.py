@@ -0,0 +1,136 @@
+"""An in-memory cache of the responses to GET requests for JSS objects"""
+from collections import OrderedDict
+import threading
+import time
+
+__author__ = 'brysontyrrell'
+
+
+class ResponseCache(object):
+    """
+    A least recently used cache of response bodies keyed by url and Accept header
+
+    Entries are grouped by resource: the url of the collection the response belongs to (e.g.
+        'https://jss/JSSResource/computers' for the collection, '.../computers/id/1' and '.../computers/name/...').
+        A write to any object of a resource invalidates every entry of the resource - the collection lists names and
+        an object can be read by id or by name
+
+    Entries expire 'ttl' seconds after they are stored. 'ttls' is a dictionary of resource paths (the last part of the
+        collection url, e.g. 'computergroups') to the seconds for that resource - 0 to not cache it
+    Once there are more than 'max_entries' entries or their bodies add up to more than 'max_bytes' the least
+        recently used entries are evicted
+
+    One ResponseCache can be shared by several JSS objects and threads. stats() returns the hits and misses
+    A GET that is answered while a write to its resource is in flight may carry the old body: read generation() before
+        sending the GET and pass it to put() - the body is not stored if the resource was invalidated in between
+    """
+    def __init__(self, max_entries=1000, max_bytes=64 * 1048576, ttl=300, ttls=None):
+        """Initialize the ResponseCache class"""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.ttls = dict(ttls or {})
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._resources = dict()
+        self._generations = dict()
+        self._clears = 0
+        self._bytes = 0
+        self._counts = dict(hits=0, misses=0, expired=0, evictions=0, invalidations=0)
+
+    def _ttl(self, resource):
+        """Returns the seconds entries of a resource are kept"""
+        return self.ttls.get(resource.rsplit('/', 1)[-1], self.ttl)
+
+    def _remove(self, key):
+        """Removes an entry (the lock must be held)"""
+        resource, expires, body = self._entries.pop(key)
+        self._bytes -= len(body)
+        keys = self._resources[resource]
+        keys.discard(key)
+        if not keys:
+            del self._resources[resource]
+
+    def get(self, resource, url, accept):
+        """Returns the body stored for a url and Accept header or None if there is none or it has expired"""
+        key = (url, accept)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                self._remove(key)
+                self._counts['expired'] += 1
+                entry = None
+
+            if entry is None:
+                self._counts['misses'] += 1
+                return None
+
+            # Move the entry to the most recently used end
+            del self._entries[key]
+            self._entries[key] = entry
+            self._counts['hits'] += 1
+            return entry[2]
+
+    def generation(self, resource):
+        """Returns a value that changes every time a resource is invalidated (or the cache cleared)"""
+        with self._lock:
+            return self._clears, self._generations.get(resource, 0)
+
+    def put(self, resource, url, accept, body, generation=None):
+        """
+        Stores the body of a response and evicts the least recently used entries over the limits
+            the body is not stored if 'generation' is passed and the resource has been invalidated since it was read
+        """
+        ttl = self._ttl(resource)
+        if ttl <= 0 or len(body) > self.max_bytes:
+            return
+
+        key = (url, accept)
+        with self._lock:
+            if generation is not None and generation != (self._clears, self._generations.get(resource, 0)):
+                return
+
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (resource, time.time() + ttl, body)
+            self._resources.setdefault(resource, set()).add(key)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._counts['evictions'] += 1
+
+    def invalidate(self, resource):
+        """Removes every entry of a resource"""
+        with self._lock:
+            self._generations[resource] = self._generations.get(resource, 0) + 1
+            keys = list(self._resources.get(resource, ()))
+            for key in keys:
+                self._remove(key)
+
+            if keys:
+                self._counts['invalidations'] += 1
+
+    def clear(self):
+        """Removes every entry"""
+        with self._lock:
+            self._clears += 1
+            self._entries.clear()
+            self._resources.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Returns a dictionary of the use of the cache:
+            'hits' and 'misses': GET requests answered from the cache and sent to the JSS
+            'expired': misses because the entry was older than its ttl
+            'evictions': entries removed to stay within 'max_entries' and 'max_bytes'
+            'invalidations': writes that removed entries of their resource
+            'entries' and 'bytes': what the cache holds now
+        """
+        with self._lock:
+            stats = dict(self._counts)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+
+        return stats
@@ -0,0 +1,100 @@
+"""An on-disk store of JSS objects that can stand in for a live source JSS"""
+import sqlite3
+import threading
+import time
+import zlib
+from jsslib import ReadOnlyJSS
+
+__author__ = 'brysontyrrell'
+
+
+class Snapshot(ReadOnlyJSS):
+    """
+    A read-only copy of the objects on a JSS stored in a SQLite database at 'path'
+
+    The raw XML of every GET is stored compressed along with the time it was fetched, keyed by the resource path
+        (e.g. 'computers') and the rest of the url ('' for the collection, 'id/1' or 'name/...' for an object)
+
+    Only GET requests are answered (see jsslib.ReadOnlyJSS). A subset of an object is answered with the whole object
+        if only that was stored. A KeyError is raised for anything that is not in the snapshot
+
+    A live JSS reads through a Snapshot passed as JSS(..., snapshot=Snapshot(path)): GET requests are answered from
+        the snapshot when possible and stored in it otherwise. promoter.snapshot() fills a Snapshot from a JSS
+    """
+    def __init__(self, path):
+        """Initialize the Snapshot class"""
+        super(Snapshot, self).__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS objects ('
+                         'resource TEXT, key TEXT, fetched REAL, xml BLOB, PRIMARY KEY (resource, key))')
+        self._db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+
+    @staticmethod
+    def _split_key(key):
+        """Splits a url relative to /JSSResource into the resource path and the rest of the url"""
+        parts = key.split('/', 1)
+        return parts[0], parts[1] if len(parts) > 1 else ''
+
+    def get(self, key):
+        """Returns the XML stored for a url relative to /JSSResource or None if it is not in the snapshot"""
+        with self._lock:
+            row = self._db.execute('SELECT xml FROM objects WHERE resource = ? AND key = ?',
+                                   self._split_key(key)).fetchone()
+
+        return zlib.decompress(bytes(row[0])).decode('utf-8') if row else None
+
+    def fetched(self, key):
+        """Returns the time (in seconds since the epoch) the XML for a url was stored or None"""
+        with self._lock:
+            row = self._db.execute('SELECT fetched FROM objects WHERE resource = ? AND key = ?',
+                                   self._split_key(key)).fetchone()
+
+        return row[0] if row else None
+
+    def put(self, key, xml):
+        """Stores the XML for a url relative to /JSSResource"""
+        resource, rest = self._split_key(key)
+        data = sqlite3.Binary(zlib.compress(xml.encode('utf-8')))
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO objects (resource, key, fetched, xml) VALUES (?, ?, ?, ?)',
+                             (resource, rest, time.time(), data))
+
+    def clear(self):
+        """Removes everything from the snapshot"""
+        with self._lock:
+            self._db.execute('DELETE FROM objects')
+            self._db.execute('DELETE FROM meta')
+
+    def close(self):
+        """Closes the database"""
+        with self._lock:
+            self._db.close()
+
+    @property
+    def version(self):
+        """The version of the JSS the snapshot was taken from (None if it was not stored)"""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+
+        return row[0] if row else None
+
+    @version.setter
+    def version(self, value):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)", (value,))
+
+    def _get(self, url, list_value=None, group_filter=None):
+        """Returns the stored XML for a url the same way jsslib.JSS._get() does"""
+        key = url[len(self._url) + 1:]
+        xml = self.get(key)
+        if xml is None and '/subset/' in key:
+            xml = self.get(key.split('/subset/')[0])
+
+        if xml is None:
+            raise KeyError("'{}' is not in the snapshot {}".format(key, self.path))
+
+        return self._parse_get(xml, list_value, group_filter)
@@ -0,0 +1,183 @@
+"""
+The XML library used to parse, process and serialize JSS objects
+
+lxml is used when it is installed and xml.etree.ElementTree otherwise. Set the environment variable
+    PROMOTER_XML_BACKEND to 'etree' to use ElementTree even when lxml is installed
+
+lxml parses and serializes large records several times faster, which is where the time of promoter.process_xml()
+    goes, but applying a manifest to a parsed record is slower with lxml: every element that is touched from Python
+    is wrapped in a new proxy object. The compiled paths below use XPath with lxml because walking the tags with
+    find() is slower still (see benchmarks/bench_xml_backend.py, which reports the three stages separately)
+
+Elements from the two libraries can not be mixed in one tree: jsslib and promoter create, parse and serialize elements
+    through this module so every element they handle comes from the same library. iselement(), tostring() and
+    write() also accept xml.etree.ElementTree elements with either backend (e.g. an element built by a caller of
+    jsslib) and serialize them with that library
+"""
+import os
+import threading
+import xml.etree.ElementTree as _stdlib
+
+__author__ = 'brysontyrrell'
+
+if os.environ.get('PROMOTER_XML_BACKEND', 'lxml') == 'lxml':
+    try:
+        from lxml import etree
+    except ImportError:
+        etree = None
+else:
+    etree = None
+
+if etree is not None:
+    backend = 'lxml'
+else:
+    import xml.etree.ElementTree as etree
+    backend = 'etree'
+
+_local = threading.local()
+
+
+def _parser():
+    """
+    Returns the lxml parser of the current thread (a parser is locked while in use so threads do not share one)
+        entities are not resolved and nothing is fetched from the network while parsing
+    """
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        parser = _local.parser = etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=True)
+
+    return parser
+
+
+def fromstring(data):
+    """Returns the root ElementTree.Element of an XML document passed as bytes (preferred) or text"""
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+
+    if backend == 'lxml':
+        return etree.fromstring(data, _parser())
+
+    return etree.fromstring(data)
+
+
+def tostring(element, encoding='us-ascii'):
+    """
+    Returns an element serialized to bytes without an XML declaration
+        the default 'us-ascii' writes characters outside of ASCII as character references - pass 'utf-8' to write
+        them as UTF-8
+    """
+    return _library(element).tostring(element, encoding=encoding)
+
+
+def write(element, file, encoding='us-ascii'):
+    """
+    Serializes an element to a file object opened for binary writing the same way as tostring() - the XML is written
+        as it is serialized rather than built up in memory first
+    """
+    _library(element).ElementTree(element).write(file, encoding=encoding)
+
+
+def _library(element):
+    """Returns the module that serializes an element: the backend or xml.etree.ElementTree for its elements"""
+    if backend == 'lxml' and not etree.iselement(element) and _stdlib.iselement(element):
+        return _stdlib
+
+    return etree
+
+
+def iselement(value):
+    """Tests if a value is an element of the backend or of xml.etree.ElementTree"""
+    return etree.iselement(value) or (backend == 'lxml' and _stdlib.iselement(value))
+
+
+def iterparse(source, events=('end',)):
+    """Returns an iterator of (event, element) pairs as an XML document is read from a file object"""
+    if backend == 'lxml':
+        return etree.iterparse(source, events=events, resolve_entities=False, no_network=True, huge_tree=True)
+
+    return etree.iterparse(source, events=events)
+
+
+def compile_path(tags):
+    """
+    Returns a function that finds the element at the end of a list of tags under an element or None
+        Each tag matches the first child with that tag (the same as calling Element.find() once for each tag). With
+        lxml the path is compiled to an XPath expression once and evaluated in C for every element
+    """
+    if not tags:
+        return lambda root: root
+
+    if backend == 'lxml':
+        xpath = etree.XPath('/'.join('{}[1]'.format(tag) for tag in tags))
+
+        def find(root):
+            found = xpath(root)
+            return found[0] if found else None
+
+        return find
+
+    def find(root):
+        node = root
+        for tag in tags:
+            node = node.find(tag)
+            if node is None:
+                return None
+
+        return node
+
+    return find
+
+
+def compile_strip(tags, tag):
+    """
+    Returns a function that removes the first child with 'tag' from every child of the element at the end of a list
+        of tags under an element (see compile_path()) - e.g. the ids of the objects in a collection
+    """
+    if backend == 'lxml':
+        xpath = etree.XPath('/'.join(['{}[1]'.format(i) for i in tags] + ['*', '{}[1]'.format(tag)]))
+
+        def strip(root):
+            for element in xpath(root):
+                element.getparent().remove(element)
+
+        return strip
+
+    find = compile_path(tags)
+
+    def strip(root):
+        collection = find(root)
+        if collection is not None:
+            for i in collection:
+                element = i.find(tag)
+                if element is not None:
+                    i.remove(element)
+
+    return strip
+
+
+def compile_remove(paths):
+    """
+    Returns a function that removes the elements at the ends of lists of tags under an element (see compile_path())
+        With lxml all of the paths are compiled to one XPath expression
+    """
+    if backend == 'lxml':
+        xpath = etree.XPath(' | '.join('/'.join('{}[1]'.format(tag) for tag in tags) for tags in paths))
+
+        def remove(root):
+            for element in xpath(root):
+                parent = element.getparent()
+                if parent is not None:
+                    parent.remove(element)
+
+        return remove
+
+    finders = [(compile_path(tags[:-1]), tags[-1]) for tags in paths]
+
+    def remove(root):
+        for find, tag in finders:
+            parent = find(root)
+            child = parent.find(tag) if parent is not None else None
+            if child is not None:
+                parent.remove(child)
+
+    return remove